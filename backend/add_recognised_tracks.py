@@ -1,51 +1,42 @@
 import pandas as pd
 from spotify_integration.auth import get_spotify_client
-from spotify_integration.csv_reader import load_recognition_log_as_df
-from spotify_integration.search_tracks import search_spotify_track
+from spotify_integration.csv_reader import read_history, update_history_uris
+from spotify_integration.resolver import resolve_tracks
 from spotify_integration.playlist_manager import get_or_create_playlist, add_tracks_to_playlist
 
-RECOGNITION_CSV_PATH = "backend/logs/recognition_log.csv"
+RECOGNITION_CSV_PATH = "backend/logs/recognition_history.csv"
 PLAYLIST_NAME = "ig2spotify"
 
 def main():
-    print("📥 Loading recognised tracks from recognition_log.csv")
-    df_full = load_recognition_log_as_df(RECOGNITION_CSV_PATH)
+    print("📥 Loading recognised tracks from recognition history")
+    df_full = read_history(RECOGNITION_CSV_PATH)
     if df_full.empty:
         print("⚠️ No recognised tracks found.")
         return
 
-    df_full = df_full.dropna(subset=["title", "artist"])
+    df_full = df_full[(df_full["title"].fillna("") != "") & (df_full["artist"].fillna("") != "")]
 
     # Find only unmatched
     df_unmatched = df_full[df_full["spotify_uri"].isna() | (df_full["spotify_uri"].str.strip() == "")]
     print(f"🔍 {len(df_unmatched)} unmatched tracks to process...")
 
     sp = get_spotify_client()
-    playlist_id = get_or_create_playlist(sp, PLAYLIST_NAME)
+    playlist_id = get_or_create_playlist(sp, PLAYLIST_NAME, None, None)
 
-    new_uris = []
-
-    for idx, row in df_unmatched.iterrows():
-        title = row["title"]
-        artist = row["artist"]
-        print(f"🎧 Searching: {title} – {artist}")
-
-        uri = search_spotify_track(sp, title, artist)
-        if uri:
-            print(f"✅ Found match: {uri}")
-            df_full.loc[idx, "spotify_uri"] = uri
-            new_uris.append(uri)
-        else:
-            print("❌ No match found")
+    # Same resolver (and URI cache) as the full pipeline
+    pairs = list(zip(df_unmatched["title"], df_unmatched["artist"]))
+    resolved = resolve_tracks(get_spotify_client(retry_rate_limits=False), pairs)
+    matched = {idx: resolved[p] for idx, p in zip(df_unmatched.index, pairs) if resolved.get(p)}
+    new_uris = list(matched.values())
 
     if new_uris:
-        add_tracks_to_playlist(sp, playlist_id, new_uris)
+        add_tracks_to_playlist(sp, playlist_id, new_uris, None)
     else:
         print("🎵 No new tracks to add to playlist.")
 
-    # Save full DataFrame, not just unmatched
-    df_full.to_csv(RECOGNITION_CSV_PATH, index=False)
-    print("💾 recognition_log.csv updated successfully.")
+    # Only the matched rows are written back
+    update_history_uris(matched, RECOGNITION_CSV_PATH)
+    print(f"💾 {len(matched)} history rows updated successfully.")
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,57 @@
 # Backend/app/main.py
+import asyncio
+import json
+import os
 import uuid
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from spotify_integration.csv_reader import read_history
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from backend.progress import PROGRESS_DATA
+from backend import jobs
+from backend.progress import stage_deltas, throughput
+from backend.recognisers import get_chain
+from backend.worker import start_workers
 
-# import existing automation functions
-from backend.full_pipeline import run_full_pipeline
+# Runs execute in worker processes fed by the backend.jobs queue. This many are
+# started with each API process (so `uvicorn --workers N` starts N * JOB_WORKERS);
+# 0 leaves it to separately run `python -m backend.worker`.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
 
 # In memory store of run parameters (lives until restart uvicorn)
 run_metadata: dict[str, dict] = {}
 
+# Progress event stream: the run is checked at most once per interval (bursts are
+# coalesced into stage counts), and a comment line keeps idle connections open
+EVENTS_MIN_INTERVAL = float(os.getenv("EVENTS_MIN_INTERVAL", "0.5"))
+EVENTS_KEEPALIVE = 15
+
 # For type-safety in request bodies
 class RunRequest(BaseModel):
     instagram_username: str
     playlist_name: str 
     limit : int = 10 # Optional limit for reels to process, default is 10
+    recognisers: str | None = None # e.g. "acrcloud,shazam" or "fake"; default RECOGNISERS env
+    incremental: bool | None = None # stop at reels ingested by earlier runs; default INCREMENTAL_CRAWL env
+
+class BatchAccount(BaseModel):
+    instagram_username: str
+    playlist_name: str
+    limit: int = 10
+
+class BatchRequest(BaseModel):
+    accounts: list[BatchAccount]
+    recognisers: str | None = None
+    incremental: bool | None = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if JOB_WORKERS > 0:
+        start_workers(JOB_WORKERS)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -32,55 +64,165 @@ app.add_middleware(
 )
 
 @app.post("/api/run")
-async def start_run(req: RunRequest, bg: BackgroundTasks):
+async def start_run(req: RunRequest):
     """
-    Kick off the full automation pipeline in the background.
-    Returns an immediate response to the client to state the task has begun.
+    Queue the full automation pipeline for a worker process.
+    Returns an immediate response to the client to state the task has been queued.
     """
+    # Reject unknown recogniser names before anything starts
+    try:
+        get_chain(req.recognisers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Generate a unique run ID
     runId = uuid.uuid4().hex
 
-    # 2 store the run parameters in memory
-    PROGRESS_DATA[runId] = {
+    # 2 store the run parameters and initial counters with the job
+    progress = _initial_progress(runId, req.limit) | {
+        "instagram_username": req.instagram_username,
+        "playlist_name": req.playlist_name or "ig2spotify",
+    }
+    params = {
+        "instagram_username": req.instagram_username,
+        "playlist_name": req.playlist_name,
+        "limit": req.limit,
+        "recognisers": req.recognisers,
+        "incremental": req.incremental,
+    }
+    jobs.enqueue(runId, req.instagram_username, params, progress)
+    return {"message": "Pipeline queued", "runId": runId}
+
+@app.post("/api/batch")
+async def start_batch(req: BatchRequest):
+    """
+    Queue one run over several accounts, sharing a browser pool, recogniser and
+    Spotify client. Each account also gets its own run ID (`<batchId>.<username>`)
+    that works with the status endpoints once the batch has started.
+    """
+    usernames = [a.instagram_username for a in req.accounts]
+    if not usernames:
+        raise HTTPException(status_code=400, detail="No accounts given")
+    if len(set(usernames)) != len(usernames):
+        raise HTTPException(status_code=400, detail="Duplicate accounts in batch")
+    try:
+        get_chain(req.recognisers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    batchId = uuid.uuid4().hex
+    runIds = {u: f"{batchId}.{u}" for u in usernames}
+    progress = _initial_progress(batchId, sum(a.limit for a in req.accounts)) | {
+        "accounts": usernames,
+        "runIds": runIds,
+        "runs": {},
+    }
+    params = {
+        "accounts": [a.dict() for a in req.accounts],
+        "recognisers": req.recognisers,
+        "incremental": req.incremental,
+    }
+    # The whole batch is one job, counted against JOBS_PER_ACCOUNT for every member
+    jobs.enqueue(batchId, usernames, params, progress)
+    return {"message": "Batch queued", "batchId": batchId, "runIds": runIds}
+
+def _initial_progress(runId: str, limit: int) -> dict:
+    return {
         "reels_downloaded": 0,
         "audio_converted": 0,
         "track_recognition_processed": 0,
+        "processed": 0,
+        "outcomes": {},
+        "recognition_cache_hits": 0,
+        "recognition_cache_misses": 0,
+        "tracks_resolved": 0,
         "tracks_matched": 0,
         "playlist_done": False,
-        "instagram_username": req.instagram_username,
-        "playlist_name": req.playlist_name or "ig2spotify",
-        "limit": req.limit,
+        "limit": limit,
         'runId': runId,
     }
 
-    # RUn full_pipeline, returns nothing
-    bg.add_task(run_full_pipeline, 
-                req.instagram_username, 
-                req.playlist_name, 
-                req.limit,
-                runId=runId)
-    return {"message": "Pipeline started", "runId": runId}
+def _run_state(runId: str) -> dict | None:
+    """
+    Persisted progress of a run plus its job state and throughput, or None if
+    unknown. An account of a batch reads its entry in the batch job's progress.
+    """
+    job = jobs.get(runId)
+    if job is not None:
+        run = job["progress"]
+    elif "." in runId:
+        job = jobs.get(runId.split(".", 1)[0])
+        run = job and job["progress"].get("runs", {}).get(runId)
+        if run is None:
+            return None
+    else:
+        return None
+    return run | {
+        "total": run["limit"],
+        "throughput": throughput(run),
+        "job_status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+    }
 
 @app.get("/api/runs/{runId}/status")
 async def get_run_status(runId: str):
     """
     Return progress for a given run ID.
+    One primary-key read of the jobs table (WAL: never blocked by the workers
+    writing progress); the recognition history is never touched.
     """
-    # Look up the stored run parameters
-    if PROGRESS_DATA:
-        # If run_metadata is empty, we can skip this check
-        meta = PROGRESS_DATA.get(runId)
-        if not meta:
-            raise HTTPException(status_code=404, detail="Run ID not found")
+    run = await asyncio.to_thread(_run_state, runId)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run ID not found")
 
-    total_expected = meta["limit"]
+    # Return JSON with everything the front end needs
+    return run
 
-    # Load all history for this run
 
-    df = read_history("recognition_history.csv") # read the master history log
-    df_run = df[df['run_id'] == runId] # Filter down to just this run
-    processed = len(df_run)
+def _unchanged(last: dict, current: dict) -> bool:
+    # Throughput moves with the clock alone; it rides along with real changes
+    return {**last, "throughput": None} == {**current, "throughput": None}
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    # Return JSON with everything the front end needs
-    return PROGRESS_DATA[runId] | {}
\ No newline at end of file
+@app.get("/api/runs/{runId}/events")
+async def stream_run_events(runId: str, request: Request):
+    """
+    Server-sent events for a run, pushed as stages advance instead of polled.
+    `progress` events carry {"stages": {stage: count since last event}, "status": snapshot};
+    a final `done` event carries the finished snapshot, then the stream closes
+    (an `error` event instead, if the run disappears). The sqlite reads run on a
+    thread, so many open streams never block the event loop.
+    """
+    run = await asyncio.to_thread(_run_state, runId)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run ID not found")
+
+    async def events():
+        last = run
+        idle = 0.0
+        yield _sse("progress", {"stages": {}, "status": last})
+        while last["job_status"] not in (jobs.DONE, jobs.FAILED):
+            await asyncio.sleep(EVENTS_MIN_INTERVAL)
+            if await request.is_disconnected():
+                return
+            current = await asyncio.to_thread(_run_state, runId)
+            if current is None:
+                yield _sse("error", {"detail": "Run ID not found"})
+                return
+            if _unchanged(last, current):
+                idle += EVENTS_MIN_INTERVAL
+                if idle >= EVENTS_KEEPALIVE:
+                    idle = 0.0
+                    yield ": keepalive\n\n"
+                continue
+            idle = 0.0
+            # Everything since the last check goes out as one event
+            yield _sse("progress", {"stages": stage_deltas(last, current), "status": current})
+            last = current
+        yield _sse("done", last)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
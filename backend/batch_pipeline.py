@@ -0,0 +1,253 @@
+# backend/batch_pipeline.py
+# Streaming pipeline over many Instagram accounts in one run.
+#
+#   crawl (one thread per pooled browser) -> trim -> recognise -> resolve -> playlist writes
+#
+# Every account shares the browser pool (and its logged-in sessions), the
+# recogniser chain, the Spotify client and the resolution caches. Crawled reels
+# enter the stages through a FairQueue, so accounts being crawled at the same
+# time take turns instead of the fastest profile monopolising recognition.
+# Each account is a child run (`<batchId>.<username>`) of the batch run, whose
+# counters are the totals (see backend.progress).
+import collections
+import os
+import queue
+import threading
+import time
+
+from backend import recognise_audio
+from backend.crawl_watermark import ingested
+from backend.driver_pool import POOL_SIZE
+from backend.processed_index import ProcessedIndex
+from backend.progress import RunCancelled, increment, raise_if_cancelled, start_run, update
+from backend.progress import status as run_status
+from backend.recognisers import get_chain
+from backend.selenium_wire_download_reels import download_user_reels
+from backend.streaming_pipeline import (QUEUE_SIZE, STAGE_WORKERS, WRITE_BATCH, WRITE_FLUSH_SECONDS,
+                                        Stage, _DONE)
+from spotify_integration.auth import get_spotify_client
+from spotify_integration.csv_reader import update_history_uris, write_current
+from spotify_integration.playlist_manager import get_or_create_playlist, add_tracks_to_playlist
+from spotify_integration.resolver import SharedBackoff, resolve_track
+from spotify_integration.uri_cache import UriCache
+
+DEFAULT_PLAYLIST_NAME = 'ig2spotify'
+
+
+class FairQueue:
+    """
+    Queue with one bounded lane per key (`key(item)`), served round-robin:
+    `get` takes the next item from the lane after the one it served last, and
+    `put` blocks only while the item's own lane is full. Putting the end marker
+    closes the queue; `get` returns it once every lane has drained.
+    """
+
+    def __init__(self, maxsize_per_key: int, key=lambda item: item[0]):
+        self.maxsize = max(1, maxsize_per_key)
+        self.key = key
+        self._lanes: collections.OrderedDict = collections.OrderedDict()
+        self._done = False
+        self._cond = threading.Condition()
+
+    def put(self, item) -> None:
+        with self._cond:
+            if item is _DONE:
+                self._done = True
+                self._cond.notify_all()
+                return
+            k = self.key(item)
+            while len(self._lanes.get(k, ())) >= self.maxsize:
+                self._cond.wait()
+            self._lanes.setdefault(k, collections.deque()).append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout: float | None = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._lanes:
+                if self._done:
+                    return _DONE
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+            k, lane = next(iter(self._lanes.items()))
+            item = lane.popleft()
+            del self._lanes[k]
+            if lane:
+                self._lanes[k] = lane  # back of the rotation
+            self._cond.notify_all()
+            return item
+
+
+def child_run_id(batchId: str, username: str) -> str:
+    return f"{batchId}.{username}"
+
+
+def run_batch_pipeline(accounts: list[dict], runId: str, recognisers=None, incremental: bool | None = None,
+                       workers: dict | None = None, queue_size: int = QUEUE_SIZE):
+    """
+    Crawl, recognise, resolve and add tracks for several accounts with shared resources.
+    `accounts` are {"instagram_username", "playlist_name", "limit"} dicts; the other
+    arguments are as for run_streaming_pipeline.
+    """
+    workers = {**STAGE_WORKERS, **(workers or {})}
+    crawlers = max(1, min(POOL_SIZE, len(accounts)))
+    print(f"🚀 Batch pipeline for {len(accounts)} accounts (crawlers={crawlers}, workers={workers})")
+
+    sp = get_spotify_client()
+    search_sp = get_spotify_client(retry_rate_limits=False)  # 429s go to the shared backoff
+    chain = get_chain(recognisers)
+    index = ProcessedIndex()
+    uri_cache = UriCache()
+    backoff = SharedBackoff()
+    run_records = []
+    records_lock = threading.Lock()
+
+    children, playlist_names = {}, {}
+    for account in accounts:
+        username = account['instagram_username']
+        childId = child_run_id(runId, username)
+        children[username] = childId
+        playlist_names[username] = account.get('playlist_name') or DEFAULT_PLAYLIST_NAME
+        start_run(childId, {
+            "reels_downloaded": 0, "audio_converted": 0, "track_recognition_processed": 0,
+            "processed": 0, "outcomes": {}, "recognition_cache_hits": 0, "recognition_cache_misses": 0,
+            "tracks_resolved": 0, "tracks_matched": 0, "playlist_done": False,
+            "instagram_username": username,
+            "playlist_name": playlist_names[username],
+            "limit": account.get('limit', 10), "runId": childId, "started_at": time.time(),
+        }, parent=runId)
+
+    try:
+        downloaded = FairQueue(queue_size // crawlers)
+        trimmed = queue.Queue(queue_size)
+        recognised = queue.Queue(queue_size)
+        resolved = queue.Queue(queue_size)
+
+        # -- crawl ------------------------------------------------------------
+        todo = queue.Queue()
+        for account in accounts:
+            todo.put(account)
+
+        def crawl():
+            while True:
+                try:
+                    raise_if_cancelled(runId)  # before taking a browser and logging in for the next account
+                    account = todo.get_nowait()
+                except (queue.Empty, RunCancelled):
+                    return
+                username = account['instagram_username']
+                childId = children[username]
+                try:
+                    # downloaded.put blocks while this account's lane is full: backpressure per account
+                    download_user_reels(username, account.get('limit', 10), childId,
+                                        on_reel=lambda path: downloaded.put((username, path)), incremental=incremental)
+                except RunCancelled:
+                    return
+                except Exception as e:
+                    print(f"❌ Crawl of {username} failed: {e}")
+                update(childId, crawled_at=time.time())
+
+        # -- stage functions --------------------------------------------------
+        def trim(item):
+            username, path = item
+            childId = children[username]
+            fingerprint = recognise_audio.claim_file(path, index)
+            if fingerprint is None:
+                return None
+            return username, path, fingerprint, recognise_audio.prepare_file(path, childId)
+
+        def recognise(item):
+            username, path, fingerprint, proc = item
+            childId = children[username]
+            status, title, artist, window = recognise_audio.recognise_file(proc, path, childId, chain)
+            record = recognise_audio.record_result(os.path.basename(path), status, title, artist,
+                                                   childId, fingerprint, username, window)
+            ingested(path)
+            with records_lock:
+                run_records.append(record)
+            increment(childId, 'track_recognition_processed')
+            return (username, record) if status == 'SUCCESS' else None
+
+        def resolve(item):
+            username, record = item
+            uri = resolve_track(search_sp, record['title'], record['artist'], uri_cache, backoff)
+            if not uri:
+                return None
+            increment(children[username], 'tracks_resolved')
+            return username, record['id'], uri
+
+        playlists: dict[str, str] = {}
+        pending: dict[str, dict[int, str]] = {}
+
+        def flush(username):
+            uris = pending.pop(username, None)
+            if not uris:
+                return
+            childId = children[username]
+            try:
+                if username not in playlists:
+                    playlists[username] = get_or_create_playlist(sp, playlist_names[username], username, childId)
+                add_tracks_to_playlist(sp, playlists[username], list(uris.values()), childId, final=False)
+                update_history_uris(dict(uris))
+            except Exception as e:
+                # Only this account's write failed: keep draining for the others (see streaming_pipeline.flush)
+                print(f"❌ Playlist write of {len(uris)} tracks for {username} failed: {e}")
+                increment(childId, 'playlist_write_failures')
+                update(childId, playlist_error=f"{type(e).__name__}: {e}")
+
+        def write_playlists():
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    item = resolved.get(timeout=WRITE_FLUSH_SECONDS)
+                except queue.Empty:
+                    item = None
+                if item is _DONE:
+                    break
+                if item is not None:
+                    username, row_id, uri = item
+                    lane = pending.setdefault(username, {})
+                    lane[row_id] = uri
+                    if len(lane) >= WRITE_BATCH:
+                        flush(username)
+                if pending and time.monotonic() - last_flush >= WRITE_FLUSH_SECONDS:
+                    for username in list(pending):
+                        flush(username)
+                    last_flush = time.monotonic()
+            for username in list(pending):
+                flush(username)
+
+        # -- wire up and run --------------------------------------------------
+        stages = [
+            Stage("trim", trim, workers["trim"], downloaded, trimmed).start(),
+            Stage("recognise", recognise, workers["recognise"], trimmed, recognised).start(),
+            Stage("resolve", resolve, workers["resolve"], recognised, resolved).start(),
+        ]
+        writer = threading.Thread(target=write_playlists, name="playlist-writer", daemon=True)
+        writer.start()
+        crawl_threads = [threading.Thread(target=crawl, name=f"crawl-{i}", daemon=True) for i in range(crawlers)]
+        for t in crawl_threads:
+            t.start()
+
+        try:
+            for t in crawl_threads:
+                t.join()
+        finally:
+            downloaded.put(_DONE)
+            for stage in stages:
+                stage.join()
+            writer.join()
+
+        raise_if_cancelled(runId)
+        write_current(run_records)
+    finally:
+        # Close every child run however the batch ends
+        finished = time.time()
+        for childId in children.values():
+            update(childId, playlist_done=True, finished_at=finished)
+        # Child limits are the reels actually found once crawled
+        limit = sum((run_status(c) or {}).get('limit', 0) for c in children.values())
+        update(runId, limit=limit, playlist_done=True, finished_at=finished)
+    print(f"✅ Batch pipeline completed for {len(accounts)} accounts!")
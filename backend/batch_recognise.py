@@ -1,30 +1,77 @@
 import os
-import sys
 import glob
-import subprocess
-from pathlib import Path
-from backend.app.main import PROGRESS_DATA
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from backend.progress import increment
+from backend import recognise_audio
+from backend.crawl_watermark import ingested
+from backend.processed_index import ProcessedIndex
+from backend.recognisers import get_chain
+from spotify_integration.csv_reader import write_current
 
-PYTHON = sys.executable
-MODULE = "backend.recognise_audio"
-
-def batch_process(directory, runId):
-    # make sure we're in the project room so imports work
-    project_root = Path(__file__).parent.parent.resolve()
+# Number of files recognised concurrently in this process
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "4"))
 
+def batch_process(directory, runId, max_workers: int | None = None, recognisers=None):
+    """
+    Recognise every .mp4/.mp3 in `directory` in-process: clips are trimmed on a
+    TRIM_WORKERS pool and recognised on a bounded thread pool. All workers share
+    one instance of each backend in `recognisers` (default: RECOGNISERS), which
+    caps its own request rate (e.g. ACR_MAX_RPS).
+    """
     files = glob.glob(os.path.join(directory, "*.mp4")) + glob.glob(os.path.join(directory, "*.mp3"))
     files.sort()  # Optional: ensures consistent order
 
-    print(f"🎧 Found {len(files)} files in {directory}")
-    for i, file_path in enumerate(files):
-        print(f"\n➡️  [{i+1}/{len(files)}] Processing: {file_path}")
-        subprocess.run(
-            [PYTHON, "-m", MODULE, file_path, runId],
-            cwd=project_root,
-            check=True
-        )
-        PROGRESS_DATA[runId]['track_recognition_processed'] += 1
-    
+    workers = max(1, max_workers or RECOGNITION_WORKERS)
+    print(f"🎧 Found {len(files)} files in {directory} (workers={workers})")
+    if not files:
+        return
+
+    # Make sure the recognisers and processed-file index are built once before the threads start
+    chain = get_chain(recognisers)
+    index = ProcessedIndex()
+    first_record = len(recognise_audio.current_records)
+
+    def trim(file_path):
+        fingerprint = recognise_audio.claim_file(file_path, index)
+        if fingerprint is None:
+            return None
+        return fingerprint, recognise_audio.prepare_file(file_path, runId)
+
+    def recognise(file_path, fingerprint, clip):
+        status, title, artist, window = recognise_audio.recognise_file(clip, file_path, runId, chain)
+        recognise_audio.record_result(os.path.basename(file_path), status, title, artist, runId,
+                                      fingerprint, window=window)
+        ingested(file_path)
+
+    # ffmpeg trims run on their own pool (one process per core) and feed the recognisers
+    with ThreadPoolExecutor(max_workers=recognise_audio.TRIM_WORKERS, thread_name_prefix="trim") as trim_pool, \
+         ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recognise") as pool:
+        trims = {trim_pool.submit(trim, f): f for f in files}
+        futures = {}
+        for future in as_completed(trims):
+            file_path = trims[future]
+            try:
+                prepared = future.result()
+            except Exception as e:
+                print(f"❌ Trimming crashed for {file_path}: {e}")
+                prepared = None
+            if prepared is not None:
+                futures[pool.submit(recognise, file_path, *prepared)] = file_path
+            else:
+                # Already processed (or unreadable): nothing to recognise
+                increment(runId, 'track_recognition_processed')
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Recognition crashed for {file_path}: {e}")
+            print(f"➡️  [{done}/{len(futures)}] Finished: {file_path}")
+            increment(runId, 'track_recognition_processed')
+
+    # Current-run CSV holds only the records produced by this batch
+    write_current(recognise_audio.current_records[first_record:])
         
 
 # if __name__ == "__main__":
@@ -0,0 +1,113 @@
+# backend/crawl_watermark.py
+# Per-account record of reels already ingested (shortcode + audio stream base),
+# so an incremental crawl can stop as soon as it scrolls into known content
+# instead of re-walking the whole profile on every scheduled run.
+# A downloaded reel only counts as ingested once its result is in the
+# recognition history (`ingested(path)`), so a crash, a failed step or a
+# requeued job leaves it to be crawled again.
+import os
+import re
+import threading
+import time
+
+from backend.storage import ensure_schema
+
+WATERMARK_PATH = os.getenv("CRAWL_WATERMARK_PATH", "backend/logs/crawl_watermark.db")
+
+# Consecutive already-ingested reels that end an incremental crawl. Profiles can
+# pin up to 3 (old) reels above the newest ones, so fewer would stop too early.
+STOP_AFTER_SEEN = int(os.getenv("INCREMENTAL_STOP_AFTER", "4"))
+
+_SHORTCODE = re.compile(r"/reels?/([A-Za-z0-9_-]+)")
+
+
+def reel_shortcode(url: str) -> str | None:
+    """Shortcode of a reel URL (…/reel/<shortcode>/), or None for other pages."""
+    m = _SHORTCODE.search(url or "")
+    return m.group(1) if m else None
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS seen_reels (
+            account     TEXT NOT NULL,
+            shortcode   TEXT NOT NULL,
+            audio_base  TEXT,
+            ingested_at REAL NOT NULL,
+            PRIMARY KEY (account, shortcode)
+        )""")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_seen_reels_base ON seen_reels (account, audio_base)')
+    # Reels whose URL had no shortcode are known by their audio stream base only
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS seen_audio (
+            account     TEXT NOT NULL,
+            audio_base  TEXT NOT NULL,
+            ingested_at REAL NOT NULL,
+            PRIMARY KEY (account, audio_base)
+        )""")
+
+
+# Downloaded reels awaiting their history record: absolute path -> (watermark, shortcode, audio base)
+_pending: dict[str, tuple["CrawlWatermark", str | None, str]] = {}
+_pending_lock = threading.Lock()
+
+
+def ingested(path: str) -> None:
+    """Persist the watermark of the reel downloaded to `path`, if this process crawled it."""
+    with _pending_lock:
+        entry = _pending.pop(os.path.abspath(path), None)
+    if entry is not None:
+        watermark, shortcode, audio_base = entry
+        watermark.mark(shortcode, audio_base)
+
+
+class CrawlWatermark:
+    """
+    Shortcodes and audio bases already ingested for one account, loaded once
+    per crawl. `downloaded` skips a reel for the rest of the crawl; `mark`
+    (via `ingested`) records it for later crawls.
+    """
+
+    def __init__(self, account: str, path: str = WATERMARK_PATH):
+        self.account = account
+        self.path = path
+        rows = self._conn().execute('SELECT shortcode, audio_base FROM seen_reels WHERE account = ?',
+                                    (account,)).fetchall()
+        self.shortcodes = {r['shortcode'] for r in rows}
+        self.bases = {r['audio_base'] for r in rows if r['audio_base']}
+        self.bases.update(r['audio_base'] for r in self._conn().execute(
+            'SELECT audio_base FROM seen_audio WHERE account = ?', (account,)))
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return ensure_schema(self.path, 'crawl_watermark', _init_schema)
+
+    def __len__(self) -> int:
+        return len(self.shortcodes)
+
+    def seen(self, shortcode: str | None = None, audio_base: str | None = None) -> bool:
+        return (shortcode is not None and shortcode in self.shortcodes) or \
+               (audio_base is not None and audio_base in self.bases)
+
+    def _remember(self, shortcode: str | None, audio_base: str) -> None:
+        with self._lock:
+            if shortcode:
+                self.shortcodes.add(shortcode)
+            self.bases.add(audio_base)
+
+    def downloaded(self, path: str, shortcode: str | None, audio_base: str) -> None:
+        """Skip the reel for the rest of this crawl; persist it once `ingested(path)` is called."""
+        self._remember(shortcode, audio_base)
+        with _pending_lock:
+            _pending[os.path.abspath(path)] = (self, shortcode, audio_base)
+
+    def mark(self, shortcode: str | None, audio_base: str) -> None:
+        self._remember(shortcode, audio_base)
+        conn = self._conn()
+        with conn:
+            if shortcode:
+                conn.execute('INSERT OR REPLACE INTO seen_reels (account, shortcode, audio_base, ingested_at) '
+                             'VALUES (?, ?, ?, ?)', (self.account, shortcode, audio_base, time.time()))
+            else:
+                conn.execute('INSERT OR REPLACE INTO seen_audio (account, audio_base, ingested_at) '
+                             'VALUES (?, ?, ?)', (self.account, audio_base, time.time()))
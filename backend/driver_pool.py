@@ -0,0 +1,120 @@
+# backend/driver_pool.py
+# Lazily created pool of selenium-wire Chrome drivers.
+# Drivers stay alive between runs with their logged-in Instagram session, are
+# health-checked on checkout and recycled after errors or MAX_USES runs.
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+
+from backend.stream_capture import SELENIUMWIRE_OPTIONS
+
+POOL_SIZE = int(os.getenv("IG_DRIVER_POOL_SIZE", "1"))
+MAX_USES = int(os.getenv("IG_DRIVER_MAX_USES", "25"))
+WAIT_TIMEOUT = 15
+
+
+def _chrome_options() -> Options:
+    # Setup Chrome with visible window
+    chrome_options = Options()
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1200,900")
+    return chrome_options
+
+
+def _new_driver():
+    # Imported here so merely importing the pipeline never touches selenium-wire
+    from seleniumwire import webdriver
+    return webdriver.Chrome(options=_chrome_options(), seleniumwire_options=SELENIUMWIRE_OPTIONS)
+
+
+class PooledDriver:
+    """A checked-out browser plus the state we keep across runs."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.wait = WebDriverWait(driver, WAIT_TIMEOUT)
+        self.logged_in = False
+        self.uses = 0
+
+    def healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class DriverPool:
+    """
+    At most `size` browsers. `acquire()` blocks while all of them are in use and
+    only launches Chrome when no idle, healthy driver is available.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, factory=_new_driver, max_uses: int = MAX_USES):
+        self.size = max(1, size)
+        self.factory = factory
+        self.max_uses = max_uses
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: list[PooledDriver] = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> PooledDriver:
+        with self._lock:
+            while self._idle:
+                pooled = self._idle.pop()
+                if pooled.uses < self.max_uses and pooled.healthy():
+                    return pooled
+                print("♻️ Recycling stale browser")
+                pooled.quit()
+        print("🌐 Launching Chrome")
+        return PooledDriver(self.factory())
+
+    @contextmanager
+    def acquire(self):
+        self._slots.acquire()
+        pooled = None
+        try:
+            pooled = self._checkout()
+            pooled.uses += 1
+            yield pooled
+        except BaseException:
+            # Unknown browser state after a failure: don't hand it to the next run
+            if pooled:
+                pooled.quit()
+                pooled = None
+            raise
+        finally:
+            if pooled:
+                pooled.driver.response_interceptor = None
+                with self._lock:
+                    self._idle.append(pooled)
+            self._slots.release()
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            pooled.quit()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> DriverPool:
+    """The process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close_all)
+        return _pool
@@ -0,0 +1,302 @@
+# backend/fmp4.py
+# Minimal fragmented-MP4 reader for the audio-only HE-AAC files Instagram serves.
+# Enough of ISO/IEC 14496-12 to find the init segment (ftyp + moov), the
+# optional segment index (sidx) and each moof/mdat fragment's decode time and
+# duration, so the tail of a clip can be cut with memoryview slices instead of
+# spawning ffprobe/ffmpeg. Anything unexpected raises FMP4Error so callers can
+# fall back to ffmpeg.
+import struct
+from dataclasses import dataclass, field
+
+
+class FMP4Error(ValueError):
+    """The data isn't a fragmented MP4 this module can handle."""
+
+
+@dataclass
+class Box:
+    type: str
+    start: int          # offset of the box header
+    end: int            # offset just past the box
+    header: int         # header length (8 or 16)
+
+    @property
+    def payload(self) -> int:
+        return self.start + self.header
+
+
+@dataclass
+class Fragment:
+    start: int          # offset of the moof box
+    end: int            # offset just past its mdat
+    decode_time: int    # tfdt baseMediaDecodeTime, in track timescale units
+    duration: int       # sum of sample durations, in track timescale units
+
+
+@dataclass
+class SegmentIndex:
+    timescale: int
+    earliest_presentation_time: int
+    first_offset: int   # bytes from the end of the sidx box to the first fragment
+    end: int            # offset just past the sidx box
+    references: list[tuple[int, int]] = field(default_factory=list)  # (size, duration)
+
+
+@dataclass
+class Layout:
+    init_end: int                       # ftyp + moov live in [0, init_end)
+    timescale: int
+    fragments: list[Fragment]
+    sidx: SegmentIndex | None = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds covered by the fragments present."""
+        if not self.fragments:
+            return 0.0
+        first, last = self.fragments[0], self.fragments[-1]
+        return (last.decode_time + last.duration - first.decode_time) / self.timescale
+
+
+def iter_boxes(buf, start: int = 0, end: int | None = None, partial: bool = False):
+    """
+    Yield the boxes laid out back to back in buf[start:end]. With `partial`
+    (a file cut off mid-download), a truncated last box ends the iteration
+    instead of raising.
+    """
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                if partial:
+                    return
+                raise FMP4Error("truncated 64-bit box header")
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise FMP4Error(f"box {kind!r} at {pos} has no usable size")
+        if pos + size > end:
+            if partial:
+                return
+            raise FMP4Error(f"box {kind!r} at {pos} overruns its container")
+        yield Box(kind.decode("latin-1"), pos, pos + size, header)
+        pos += size
+
+
+def _child(buf, box: Box, kind: str) -> Box | None:
+    return next((b for b in iter_boxes(buf, box.payload, box.end) if b.type == kind), None)
+
+
+def _path(buf, box: Box, *kinds) -> Box | None:
+    for kind in kinds:
+        if box is None:
+            return None
+        box = _child(buf, box, kind)
+    return box
+
+
+def _full_box(buf, box: Box) -> tuple[int, int, int]:
+    """(version, flags, offset of the body after the version/flags word)."""
+    word = struct.unpack_from(">I", buf, box.payload)[0]
+    return word >> 24, word & 0xFFFFFF, box.payload + 4
+
+
+def _audio_track(buf, moov: Box) -> tuple[int, int, int]:
+    """(track_ID, timescale, trex default_sample_duration) of the first sound track."""
+    trex_defaults = {}
+    mvex = _child(buf, moov, "mvex")
+    if mvex is None:
+        raise FMP4Error("moov has no mvex: not a fragmented MP4")
+    for trex in iter_boxes(buf, mvex.payload, mvex.end):
+        if trex.type == "trex":
+            _, _, body = _full_box(buf, trex)
+            track_id, _, default_duration = struct.unpack_from(">III", buf, body)
+            trex_defaults[track_id] = default_duration
+
+    for trak in iter_boxes(buf, moov.payload, moov.end):
+        if trak.type != "trak":
+            continue
+        hdlr = _path(buf, trak, "mdia", "hdlr")
+        if hdlr is None or bytes(buf[hdlr.payload + 8:hdlr.payload + 12]) != b"soun":
+            continue
+        tkhd = _child(buf, trak, "tkhd")
+        version, _, body = _full_box(buf, tkhd)
+        track_id = struct.unpack_from(">I", buf, body + (16 if version == 1 else 8))[0]
+        mdhd = _path(buf, trak, "mdia", "mdhd")
+        version, _, body = _full_box(buf, mdhd)
+        timescale = struct.unpack_from(">I", buf, body + (16 if version == 1 else 8))[0]
+        return track_id, timescale, trex_defaults.get(track_id, 0)
+    raise FMP4Error("no audio track in moov")
+
+
+def _parse_sidx(buf, box: Box) -> SegmentIndex:
+    version, _, body = _full_box(buf, box)
+    _, timescale = struct.unpack_from(">II", buf, body)
+    body += 8
+    if version == 0:
+        ept, first_offset = struct.unpack_from(">II", buf, body)
+        body += 8
+    else:
+        ept, first_offset = struct.unpack_from(">QQ", buf, body)
+        body += 16
+    count = struct.unpack_from(">HH", buf, body)[1]
+    body += 4
+    refs = []
+    for _ in range(count):
+        word, duration, _sap = struct.unpack_from(">III", buf, body)
+        if word >> 31:
+            raise FMP4Error("hierarchical sidx references are not supported")
+        refs.append((word & 0x7FFFFFFF, duration))
+        body += 12
+    return SegmentIndex(timescale, ept, first_offset, box.end, refs)
+
+
+def _parse_moof(buf, moof: Box, track_id: int, default_duration: int) -> tuple[int, int]:
+    """(baseMediaDecodeTime, duration) of the audio track in one moof."""
+    for traf in iter_boxes(buf, moof.payload, moof.end):
+        if traf.type != "traf":
+            continue
+        tfhd = _child(buf, traf, "tfhd")
+        _, flags, body = _full_box(buf, tfhd)
+        if struct.unpack_from(">I", buf, body)[0] != track_id:
+            continue
+        if flags & 0x000001:
+            # Absolute base_data_offset: the fragment can't be moved without rewriting it
+            raise FMP4Error("tfhd uses an explicit base_data_offset")
+        body += 4
+        if flags & 0x000002:
+            body += 4   # sample_description_index
+        if flags & 0x000008:
+            default_duration = struct.unpack_from(">I", buf, body)[0]
+
+        tfdt = _child(buf, traf, "tfdt")
+        if tfdt is None:
+            raise FMP4Error("traf without tfdt")
+        version, _, body = _full_box(buf, tfdt)
+        decode_time = struct.unpack_from(">Q" if version == 1 else ">I", buf, body)[0]
+
+        duration = 0
+        for trun in iter_boxes(buf, traf.payload, traf.end):
+            if trun.type != "trun":
+                continue
+            _, tr_flags, body = _full_box(buf, trun)
+            count = struct.unpack_from(">I", buf, body)[0]
+            body += 4
+            if tr_flags & 0x000001:
+                body += 4   # data_offset
+            if tr_flags & 0x000004:
+                body += 4   # first_sample_flags
+            if tr_flags & 0x000100:
+                stride = 4 * sum(bool(tr_flags & f) for f in (0x100, 0x200, 0x400, 0x800))
+                duration += sum(struct.unpack_from(">I", buf, body + i * stride)[0] for i in range(count))
+            else:
+                duration += count * default_duration
+        return decode_time, duration
+    raise FMP4Error("moof has no fragment for the audio track")
+
+
+def parse(buf) -> Layout:
+    """
+    Locate init segment, sidx and fragments in a (possibly partial) fragmented MP4.
+    A truncated trailing box is ignored, so only complete fragments are listed.
+    """
+    buf = memoryview(buf)
+    moov = sidx = None
+    init_end = 0
+    fragments = []
+    pending_moof = None
+    track = None
+    for box in iter_boxes(buf, partial=True):
+        if box.type == "moov":
+            moov, init_end = box, box.end
+            track = _audio_track(buf, moov)
+        elif box.type == "sidx" and sidx is None:
+            sidx = _parse_sidx(buf, box)
+        elif box.type == "moof":
+            if track is None:
+                raise FMP4Error("moof before moov")
+            pending_moof = box
+        elif box.type == "mdat" and pending_moof is not None:
+            decode_time, duration = _parse_moof(buf, pending_moof, track[0], track[2])
+            fragments.append(Fragment(pending_moof.start, box.end, decode_time, duration))
+            pending_moof = None
+    if moov is None:
+        raise FMP4Error("no moov box")
+    return Layout(init_end, track[1], fragments, sidx)
+
+
+def scan_init(buf) -> tuple[list[Box], SegmentIndex | None, int | None]:
+    """
+    Walk the top-level boxes in front of the first fragment of a stream prefix.
+    Returns (init boxes, sidx, None) once a moof/mdat header is reached, or
+    (boxes so far, sidx, bytes needed) when `buf` stops short of that.
+    """
+    buf = memoryview(buf)
+    boxes, sidx, pos = [], None, 0
+    while True:
+        if pos + 16 > len(buf):
+            return boxes, sidx, pos + 16
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            size, header = struct.unpack_from(">Q", buf, pos + 8)[0], 16
+        if kind in (b"moof", b"mdat"):
+            return boxes, sidx, None
+        if size < header:
+            raise FMP4Error(f"box {kind!r} at {pos} has no usable size")
+        if pos + size > len(buf):
+            return boxes, sidx, pos + size
+        box = Box(kind.decode("latin-1"), pos, pos + size, header)
+        if box.type == "sidx" and sidx is None:
+            sidx = _parse_sidx(buf, box)
+        else:
+            boxes.append(box)
+        pos += size
+
+
+def tail_range(sidx: SegmentIndex, seconds: float) -> tuple[int, int, float]:
+    """
+    (first byte, last byte, seconds covered) of the shortest run of trailing
+    fragments listed in `sidx` that holds at least `seconds` of audio.
+    """
+    if not sidx.references:
+        raise FMP4Error("empty sidx")
+    end = sidx.end + sidx.first_offset + sum(size for size, _ in sidx.references)
+    start, covered = end, 0
+    for size, duration in reversed(sidx.references):
+        start -= size
+        covered += duration
+        if covered >= seconds * sidx.timescale:
+            break
+    return start, end - 1, covered / sidx.timescale
+
+
+def window(buf, start: float, seconds: float, layout: Layout | None = None) -> bytes:
+    """
+    A playable fragmented MP4 holding the init segment plus the fragments that
+    overlap [start, start + seconds) (in seconds from the first fragment), at
+    fragment granularity, so slightly more. Pass `layout` to reuse one parse
+    for several windows. Only the output join copies; selection uses memoryview slices.
+    """
+    view = memoryview(buf)
+    layout = layout or parse(view)
+    if not layout.fragments:
+        raise FMP4Error("no complete fragments")
+    origin = layout.fragments[0].decode_time
+    lo = origin + start * layout.timescale
+    hi = lo + seconds * layout.timescale
+    keep = [f for f in layout.fragments if f.decode_time + f.duration > lo and f.decode_time < hi]
+    # ftyp + moov only: a copied sidx would point at fragments we dropped
+    init = [view[b.start:b.end] for b in iter_boxes(view, 0, layout.init_end) if b.type in ("ftyp", "moov")]
+    return b"".join(init + [view[f.start:f.end] for f in keep])
+
+
+def tail(buf, seconds: float) -> bytes:
+    """The init segment plus the fragments covering the last `seconds` of audio."""
+    layout = parse(buf)
+    return window(buf, max(0.0, layout.duration - seconds), seconds, layout)
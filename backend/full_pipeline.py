@@ -2,18 +2,26 @@ import os
 import pandas as pd
 
 from spotify_integration.auth import get_spotify_client
-from spotify_integration.csv_reader import write_current, read_history
+from spotify_integration.csv_reader import write_current, read_history, update_history_uris
 from spotify_integration.playlist_manager import get_or_create_playlist, add_tracks_to_playlist
-from spotify_integration.search_tracks import search_spotify_track
+from spotify_integration.resolver import resolve_tracks
 
+from backend.progress import increment, update
 from backend.selenium_wire_download_reels import download_user_reels
 from backend.batch_recognise import batch_process
+from backend.streaming_pipeline import run_streaming_pipeline
 
-# Use the history CSV maintained by csv_reader
+# History location maintained by csv_reader (backed by recognition_history.db)
 RECOGNITION_LOG_PATH = 'backend/logs/recognition_history.csv'
 DOWNLOAD_DIR = 'downloaded_reels'
 DEFAULT_PLAYLIST_NAME = 'ig2spotify'
 
+# "phased" runs each step over the whole account before starting the next, then
+# sweeps every unmatched history row (older runs included) into the playlist.
+# "streaming" overlaps download/recognition/resolution per reel
+# (backend.streaming_pipeline) but only resolves this run's recognitions.
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'phased')
+
 # RUN_ID = uuid.uuid4().hex
 
 # Clear current-run if you're using read_current elsewhere;
@@ -21,18 +29,34 @@ DEFAULT_PLAYLIST_NAME = 'ig2spotify'
 write_current([])
 
 
-def run_full_pipeline(instagram_username: str, playlist_name: str = DEFAULT_PLAYLIST_NAME, limit: int = 10, runId: str = None):
+def run_full_pipeline(instagram_username: str, playlist_name: str = DEFAULT_PLAYLIST_NAME, limit: int = 10, runId: str = None,
+                      mode: str = None, recognisers: str = None, incremental: bool = None):
+    try:
+        if (mode or PIPELINE_MODE) == 'streaming':
+            return run_streaming_pipeline(instagram_username, playlist_name or DEFAULT_PLAYLIST_NAME, limit, runId,
+                                          recognisers=recognisers, incremental=incremental)
+        return _run_phased_pipeline(instagram_username, playlist_name, limit, runId, recognisers, incremental)
+    except Exception as e:
+        update(runId, pipeline_error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        # However the run ends (early return, nothing to add, or an error), it is over
+        update(runId, playlist_done=True)
+
+
+def _run_phased_pipeline(instagram_username: str, playlist_name: str, limit: int, runId: str,
+                         recognisers: str, incremental: bool):
     print(f"🚀 Starting full pipeline for Instagram account: {instagram_username}")
 
     # Step 1: Download reels
     user_dir = os.path.join(DOWNLOAD_DIR, instagram_username)
     os.makedirs(user_dir, exist_ok=True)
     print("📹 Downloading reels...")
-    download_user_reels(instagram_username, limit, runId)
+    download_user_reels(instagram_username, limit, runId, incremental=incremental)
 
     # Step 2: Recognise audio
     print("🎧 Recognising audio...")
-    batch_process(user_dir, runId)
+    batch_process(user_dir, runId, recognisers=recognisers)
 
     # Step 3: Load Spotify client
     print("🔑 Logging into Spotify...")
@@ -56,21 +80,23 @@ def run_full_pipeline(instagram_username: str, playlist_name: str = DEFAULT_PLAY
         print("🎵 All tracks are already matched.")
         return
 
-    # Step 5: Search Spotify for URIs
-    new_uris = []
-    for idx, row in unmatched.iterrows():
-        title, artist = row['title'], row['artist']
-        print(f"🔍 Searching: {title} – {artist}")
-        if (title or artist) != '': 
-            uri = search_spotify_track(sp, title, artist)
-            if uri:
-                print(f"✅ Found URI: {uri}")
-                df.at[idx, 'spotify_uri'] = uri
-                new_uris.append(uri)
-            else:
-                print("❌ No match found.")
-        else:
-            print("❌ No search completed, missing artist or title.")
+    # Step 5: Search Spotify for URIs (unique title/artist pairs, concurrently)
+    searchable = unmatched[(unmatched['title'] != '') | (unmatched['artist'] != '')]
+    skipped = len(unmatched) - len(searchable)
+    if skipped:
+        print(f"❌ Skipping {skipped} rows missing both artist and title.")
+    pairs = list(zip(searchable['title'], searchable['artist']))
+    print(f"🔍 Searching Spotify for {len(set(pairs))} unique tracks...")
+    resolved = resolve_tracks(get_spotify_client(retry_rate_limits=False), pairs)
+
+    # Write results back in bulk
+    row_uris = pd.Series([resolved.get(p) for p in pairs], index=searchable.index, dtype=object)
+    matched = row_uris.dropna().to_dict()
+    if matched:
+        df.loc[list(matched), 'spotify_uri'] = list(matched.values())
+    new_uris = list(matched.values())
+    increment(runId, 'tracks_resolved', len(matched))
+    print(f"✅ Matched {len(matched)} of {len(searchable)} rows.")
 
     # Step 6: Add to playlist
     if new_uris:
@@ -79,9 +105,9 @@ def run_full_pipeline(instagram_username: str, playlist_name: str = DEFAULT_PLAY
     else:
         print("🎵 No new tracks found to add.")
 
-    # Step 7: Save updated history log
-    df.to_csv(RECOGNITION_LOG_PATH, index=False)
-    print("💾 Updated recognition history CSV")
+    # Step 7: Save matched URIs back into the history store
+    update_history_uris(matched, RECOGNITION_LOG_PATH)
+    print(f"💾 Updated {len(matched)} history rows with Spotify URIs")
     print("✅ Full pipeline completed successfully!")
 
 
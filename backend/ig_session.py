@@ -0,0 +1,86 @@
+# backend/ig_session.py
+# On-disk cache of the authenticated Instagram cookie jar.
+# Warm starts restore it into the browser and the segment download session
+# after a cheap HTTP probe, and only fall back to insta_login when it expired.
+import json
+import os
+import time
+
+import requests
+
+from backend.segment_downloader import get_session, set_cookies
+
+SESSION_CACHE_PATH = os.getenv("IG_SESSION_CACHE", ".cache-ig-session.json")
+PROBE_URL = "https://www.instagram.com/accounts/edit/"
+PROBE_TIMEOUT = 10
+_USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+               "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+
+def save_cookies(cookies: list[dict], path: str = SESSION_CACHE_PATH) -> None:
+    """Write the cookie jar readable by the current user only (0600), atomically."""
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"saved_at": time.time(), "cookies": cookies}, f)
+    os.replace(tmp, path)
+
+
+def load_cookies(path: str = SESSION_CACHE_PATH) -> list[dict] | None:
+    """Unexpired cookies from the cache, or None if there's no usable session."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            cookies = json.load(f)["cookies"]
+    except (OSError, ValueError, KeyError):
+        return None
+    now = time.time()
+    cookies = [c for c in cookies if not c.get("expiry") or c["expiry"] > now]
+    if not any(c["name"] == "sessionid" for c in cookies):
+        return None
+    return cookies
+
+
+def probe(cookies: list[dict]) -> bool:
+    """
+    One request with the cached cookies: a logged-in session gets the settings
+    page (200), an expired one is redirected to the login page.
+    """
+    with requests.Session() as s:
+        set_cookies(cookies, s)
+        try:
+            resp = s.get(PROBE_URL, allow_redirects=False, timeout=PROBE_TIMEOUT,
+                         headers={"User-Agent": _USER_AGENT})
+        except requests.RequestException as e:
+            print(f"⚠ Instagram session probe failed: {e}")
+            return False
+    return resp.status_code == 200
+
+
+def restore_session(driver) -> bool:
+    """
+    Load cached cookies into `driver` and the download session if they still
+    authenticate. Returns False when a full login is required.
+    """
+    cookies = load_cookies()
+    if not cookies or not probe(cookies):
+        return False
+    # Cookies can only be added for the domain currently loaded
+    driver.get("https://www.instagram.com/robots.txt")
+    for c in cookies:
+        cookie = {k: v for k, v in c.items() if k in ("name", "value", "domain", "path", "expiry", "secure", "httpOnly")}
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            print(f"⚠ Could not restore cookie {c['name']}: {e}")
+    set_cookies(cookies, get_session())
+    print("✔ Restored cached Instagram session.")
+    return True
+
+
+def remember_session(driver) -> None:
+    """Persist the driver's cookies after a successful login."""
+    cookies = driver.get_cookies()
+    save_cookies(cookies)
+    set_cookies(cookies, get_session())
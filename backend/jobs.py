@@ -0,0 +1,157 @@
+# backend/jobs.py
+# Durable run queue shared by the API and the worker processes (backend.worker).
+# Jobs live in SQLite: the API enqueues, workers claim them under a lease they
+# keep renewing, and each run's progress snapshot is persisted alongside, so
+# any API process can answer status and a run whose worker died is requeued.
+import json
+import os
+import time
+
+from backend.storage import ensure_schema
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "backend/logs/jobs.db")
+
+# Runs of the same Instagram account allowed at once (they share a login and rate limits).
+# A batch job counts against the limit of every account it crawls.
+PER_ACCOUNT_LIMIT = int(os.getenv("JOBS_PER_ACCOUNT", "1"))
+# A claimed job whose worker stops renewing for this long goes back on the queue
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Claims (first run + requeues) before a job is marked failed
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            run_id      TEXT PRIMARY KEY,
+            account     TEXT NOT NULL,
+            params      TEXT NOT NULL,
+            status      TEXT NOT NULL,
+            worker      TEXT,
+            lease_until REAL,
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            progress    TEXT NOT NULL DEFAULT '{}',
+            error       TEXT,
+            created_at  REAL NOT NULL,
+            started_at  REAL,
+            finished_at REAL
+        )""")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'initial_progress' not in existing:
+        # Counters a requeued job restarts from
+        conn.execute('ALTER TABLE jobs ADD COLUMN initial_progress TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_account ON jobs (account, status)')
+    # Instagram accounts each job crawls (one for a single run, every member of a batch)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_accounts (
+            run_id  TEXT NOT NULL,
+            account TEXT NOT NULL,
+            PRIMARY KEY (run_id, account)
+        )""")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_job_accounts_account ON job_accounts (account)')
+    # Jobs queued before job_accounts existed are limited by their own account
+    conn.execute("""INSERT INTO job_accounts (run_id, account)
+                    SELECT run_id, account FROM jobs j
+                    WHERE NOT EXISTS (SELECT 1 FROM job_accounts a WHERE a.run_id = j.run_id)""")
+
+
+def _conn(path: str):
+    return ensure_schema(path, 'jobs', _init_schema)
+
+
+def _row(row) -> dict:
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['progress'] = json.loads(job['progress'])
+    job['initial_progress'] = json.loads(job['initial_progress']) if job.get('initial_progress') else None
+    return job
+
+
+def enqueue(runId: str, account: str | list[str], params: dict, progress: dict, path: str = JOBS_DB_PATH) -> None:
+    """
+    Queue a run of one account (or a list, for a batch); `params` are the pipeline's
+    keyword arguments, `progress` its initial counters.
+    """
+    accounts = [account] if isinstance(account, str) else list(dict.fromkeys(account))
+    conn = _conn(path)
+    with conn:
+        conn.execute('INSERT INTO jobs (run_id, account, params, status, progress, initial_progress, created_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (runId, ','.join(accounts), json.dumps(params), QUEUED, json.dumps(progress),
+                      json.dumps(progress), time.time()))
+        conn.executemany('INSERT INTO job_accounts (run_id, account) VALUES (?, ?)',
+                         [(runId, a) for a in accounts])
+
+
+def claim(worker: str, per_account: int = PER_ACCOUNT_LIMIT, lease: float = LEASE_SECONDS,
+          path: str = JOBS_DB_PATH) -> dict | None:
+    """
+    Take the oldest queued job none of whose accounts is at its concurrency
+    limit, after requeueing jobs whose lease expired (their progress goes back
+    to its initial counters, as the run starts over). Returns the job, or None.
+    """
+    conn = _conn(path)
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')  # one claimer at a time across processes
+    try:
+        conn.execute("""UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                               error = CASE WHEN attempts >= ? THEN 'worker lost' ELSE error END,
+                               progress = CASE WHEN attempts >= ? THEN progress
+                                               ELSE COALESCE(initial_progress, progress) END,
+                               worker = NULL, lease_until = NULL
+                        WHERE status = ? AND lease_until < ?""",
+                     (MAX_ATTEMPTS, FAILED, QUEUED, MAX_ATTEMPTS, MAX_ATTEMPTS, RUNNING, now))
+        row = conn.execute("""SELECT * FROM jobs j WHERE status = ?
+                              AND NOT EXISTS (
+                                  SELECT 1 FROM job_accounts a WHERE a.run_id = j.run_id
+                                  AND (SELECT COUNT(*) FROM job_accounts b JOIN jobs r ON r.run_id = b.run_id
+                                       WHERE b.account = a.account AND r.status = ?) >= ?)
+                              ORDER BY created_at LIMIT 1""", (QUEUED, RUNNING, per_account)).fetchone()
+        if row is not None:
+            conn.execute("""UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1,
+                                   started_at = COALESCE(started_at, ?) WHERE run_id = ?""",
+                         (RUNNING, worker, now + lease, now, row['run_id']))
+            row = conn.execute('SELECT * FROM jobs WHERE run_id = ?', (row['run_id'],)).fetchone()
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return _row(row) if row is not None else None
+
+
+def heartbeat(runId: str, worker: str, progress: dict | None = None, lease: float = LEASE_SECONDS,
+              path: str = JOBS_DB_PATH) -> bool:
+    """
+    Renew the lease (and persist the progress snapshot, if given).
+    Returns False if the job no longer belongs to `worker`.
+    """
+    conn = _conn(path)
+    with conn:
+        if progress is None:
+            cur = conn.execute('UPDATE jobs SET lease_until = ? WHERE run_id = ? AND worker = ? AND status = ?',
+                               (time.time() + lease, runId, worker, RUNNING))
+        else:
+            cur = conn.execute('UPDATE jobs SET lease_until = ?, progress = ? WHERE run_id = ? AND worker = ? AND status = ?',
+                               (time.time() + lease, json.dumps(progress), runId, worker, RUNNING))
+    return cur.rowcount == 1
+
+
+def finish(runId: str, worker: str, status: str, progress: dict | None = None, error: str | None = None,
+           path: str = JOBS_DB_PATH) -> None:
+    """Mark the job DONE or FAILED with its final progress."""
+    conn = _conn(path)
+    with conn:
+        conn.execute("""UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL,
+                               progress = COALESCE(?, progress)
+                        WHERE run_id = ? AND worker = ?""",
+                     (status, error, time.time(), json.dumps(progress) if progress is not None else None,
+                      runId, worker))
+
+
+def get(runId: str, path: str = JOBS_DB_PATH) -> dict | None:
+    """The job row (params and progress decoded), or None."""
+    row = _conn(path).execute('SELECT * FROM jobs WHERE run_id = ?', (runId,)).fetchone()
+    return _row(row) if row is not None else None
@@ -0,0 +1,78 @@
+# backend/processed_index.py
+# In-memory set of content fingerprints already present in the history store.
+# Loaded once per batch, then kept up to date as files are claimed, so the
+# "already processed?" check is a set lookup instead of a history reload.
+# History rows from before fingerprints were recorded are matched by file name
+# instead, and get their fingerprint backfilled on the first match.
+import datetime
+import hashlib
+import os
+import threading
+
+from spotify_integration import history_store
+from spotify_integration.csv_reader import DEFAULT_HISTORY_PATH
+
+_CHUNK = 1024 * 1024
+
+
+def _recorded_before(file_path: str, timestamp: str) -> bool:
+    """True if the file already existed when a history row stamped `timestamp` was written."""
+    try:
+        recorded = datetime.datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return True  # unknown legacy format: trust the name, as before fingerprints
+    return os.path.getmtime(file_path) <= recorded
+
+
+def content_fingerprint(file_path: str) -> str:
+    """
+    Hash of the file contents. Unlike the basename, this stays the same when
+    `{profile}_reel_{n}_audio.mp4` names are reused or changed between runs.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProcessedIndex:
+    """
+    Fingerprints of every clip recorded in history, plus anything claimed since load.
+    Safe to share between recognition threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._seen = history_store.fingerprints(path)
+        self._legacy = history_store.legacy_file_names(path)
+        self._lock = threading.Lock()
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, fingerprint: str) -> None:
+        with self._lock:
+            self._seen.add(fingerprint)
+
+    def claim(self, fingerprint: str, file_path: str | None = None) -> bool:
+        """
+        Mark `fingerprint` as processed. Returns False if it already was, so two
+        threads holding the same audio don't both send it for recognition.
+        With `file_path`, a legacy (unfingerprinted) history row for the same file
+        name also counts, if the file predates that row: the same download.
+        """
+        with self._lock:
+            if fingerprint in self._seen:
+                return False
+            self._seen.add(fingerprint)
+            name = file_path and os.path.basename(file_path)
+            recorded = self._legacy.get(name) if name else None
+            if recorded is None or not _recorded_before(file_path, recorded):
+                return True
+            del self._legacy[name]
+        history_store.backfill_fingerprint(self.path, name, fingerprint)
+        return False
@@ -1,2 +1,221 @@
 # backend/progress.py
+# Per-run progress counters. Worker threads update PROGRESS_DATA under a lock
+# and publish a fresh copy of the run after every change, so status polling
+# reads a finished snapshot without taking the lock or touching disk.
+# Subscribers (the job keep-alive in backend.worker) are told which stages
+# moved on each change. A run started with a `parent` (one account of a batch)
+# also adds its counters to the parent's and appears under the parent's `runs`.
+import copy
+import threading
+import time
+from typing import Callable
+
 PROGRESS_DATA = {}
+
+# Guards read-modify-write updates coming from worker threads
+_progress_lock = threading.Lock()
+
+# Latest published copy of each run; replaced wholesale, never mutated
+_snapshots: dict[str, dict] = {}
+
+
+# Progress field -> stage event name pushed to subscribers
+STAGE_EVENTS = {
+    "reels_downloaded":            "reel_downloaded",
+    "audio_converted":             "clip_converted",
+    "track_recognition_processed": "recognised",
+    "tracks_resolved":             "matched",
+    "tracks_matched":              "playlist_written",
+    "playlist_done":               "done",
+}
+
+_subscribers: dict[str, list[Callable[[dict], None]]] = {}
+
+# child runId -> parent runId
+_parents: dict[str, str] = {}
+
+# Runs this process must stop working on (their job moved to another worker)
+_cancelled: set[str] = set()
+
+
+class RunCancelled(Exception):
+    """Raised from inside a run that was cancelled, to stop its current step."""
+
+
+def stage_deltas(before: dict, after: dict) -> dict:
+    """Stage events between two snapshots of a run, e.g. {"reel_downloaded": 2}."""
+    deltas = {}
+    for key, event in STAGE_EVENTS.items():
+        old, new = before.get(key, 0), after.get(key, 0)
+        if new != old:
+            deltas[event] = int(new) - int(old)
+    return deltas
+
+
+def _publish(runId: str, run: dict, stages: dict | None = None) -> list[tuple[Callable, dict]]:
+    # Caller holds _progress_lock, and hands the returned (callback, events) to _notify once released
+    children = run.get("runs")
+    snapshot = copy.deepcopy({k: v for k, v in run.items() if k != "runs"})
+    if children is not None:
+        snapshot["runs"] = dict(children)  # child snapshots are already immutable copies
+    _snapshots[runId] = snapshot
+    events = {STAGE_EVENTS[k]: n for k, n in (stages or {}).items() if k in STAGE_EVENTS}
+    calls = [(callback, events) for callback in _subscribers.get(runId, ())]
+
+    parentId = _parents.get(runId)
+    parent = PROGRESS_DATA.get(parentId)
+    if parent is not None:
+        parent.setdefault("runs", {})[runId] = snapshot
+        calls += _publish(parentId, parent, {k: n for k, n in (stages or {}).items() if k != "playlist_done"})
+    return calls
+
+
+def _notify(calls: list[tuple[Callable, dict]]) -> None:
+    # Outside _progress_lock, so a subscriber can never stall (or deadlock) the writers
+    for callback, events in calls:
+        callback(events)
+
+
+def _lineage(runId: str) -> list[dict]:
+    """The run followed by its parent (if any), for counters that aggregate upwards."""
+    run = PROGRESS_DATA.get(runId)
+    if run is None:
+        return []
+    parent = PROGRESS_DATA.get(_parents.get(runId))
+    return [run] if parent is None else [run, parent]
+
+
+def subscribe(runId: str, callback: Callable[[dict], None]) -> Callable[[], None]:
+    """
+    Call `callback({stage event: count})` after every change to the run (the
+    dict may be empty when only other fields changed). It runs on the writer's
+    thread after the progress lock is released, but should still only hand off.
+    Returns a function that unsubscribes.
+    """
+    with _progress_lock:
+        _subscribers.setdefault(runId, []).append(callback)
+
+    def unsubscribe():
+        with _progress_lock:
+            callbacks = _subscribers.get(runId, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                _subscribers.pop(runId, None)
+    return unsubscribe
+
+
+def cancel(runId: str) -> None:
+    """Ask a run (and its child runs) to stop: see raise_if_cancelled."""
+    with _progress_lock:
+        _cancelled.add(runId)
+
+
+def raise_if_cancelled(runId: str) -> None:
+    """
+    Raise RunCancelled if the run or its parent was cancelled. Lock-free;
+    called between reels and before recogniser and playlist calls.
+    """
+    if runId in _cancelled or _parents.get(runId) in _cancelled:
+        raise RunCancelled(f"Run {runId} was cancelled")
+
+
+def start_run(runId: str, fields: dict, parent: str | None = None) -> None:
+    """
+    Register a run with its initial counters and parameters. With `parent`,
+    its counters also accumulate into that (already started) run.
+    """
+    with _progress_lock:
+        PROGRESS_DATA[runId] = run = dict(fields)
+        if parent is not None:
+            _parents[runId] = parent
+        calls = _publish(runId, run)
+    _notify(calls)
+
+
+def update(runId: str, **fields) -> None:
+    """Thread-safe assignment of run fields; unknown runs are ignored."""
+    with _progress_lock:
+        run = PROGRESS_DATA.get(runId)
+        if run is None:
+            return
+        run.update(fields)
+        calls = _publish(runId, run, {k: 1 for k, v in fields.items() if v is not False})
+    _notify(calls)
+
+
+def status(runId: str) -> dict | None:
+    """
+    The run's latest snapshot, or None for an unknown run. Lock-free O(1):
+    a single dict lookup of an object writers never modify after publishing.
+    Treat it as read-only.
+    """
+    return _snapshots.get(runId)
+
+
+def increment(runId: str, key: str, amount: int = 1) -> None:
+    """
+    Thread-safe `PROGRESS_DATA[runId][key] += amount`.
+    Unknown runs are ignored so CLI usage without a registered run still works.
+    """
+    with _progress_lock:
+        lineage = _lineage(runId)
+        for run in lineage:
+            run[key] = run.get(key, 0) + amount
+        calls = _publish(runId, lineage[0], {key: amount}) if lineage else []
+    _notify(calls)
+
+
+def record_outcome(runId: str, outcome: str) -> None:
+    """
+    Fold one history record into the run's aggregates as it is appended:
+    `processed` (records written) and `outcomes` (count per status).
+    """
+    with _progress_lock:
+        lineage = _lineage(runId)
+        for run in lineage:
+            run["processed"] = run.get("processed", 0) + 1
+            outcomes = run.setdefault("outcomes", {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        calls = _publish(runId, lineage[0]) if lineage else []
+    _notify(calls)
+
+
+# Upper bounds (seconds) of the timing histogram buckets
+TIMING_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13)
+
+
+def observe(runId: str, name: str, seconds: float) -> None:
+    """
+    Record a duration in the run's `timings[name]` histogram:
+    {"count", "sum", "buckets": {"<=0.5": n, ..., "+inf": n}}.
+    """
+    label = next((f"<={b}" for b in TIMING_BUCKETS if seconds <= b), "+inf")
+    with _progress_lock:
+        lineage = _lineage(runId)
+        for run in lineage:
+            hist = run.setdefault("timings", {}).setdefault(name, {"count": 0, "sum": 0.0, "buckets": {}})
+            hist["count"] += 1
+            hist["sum"] = round(hist["sum"] + seconds, 3)
+            hist["buckets"][label] = hist["buckets"].get(label, 0) + 1
+        calls = _publish(runId, lineage[0]) if lineage else []
+    _notify(calls)
+
+
+# Counters reported as per-minute rates by throughput()
+THROUGHPUT_KEYS = ("reels_downloaded", "track_recognition_processed", "tracks_resolved", "tracks_matched")
+
+
+def throughput(run: dict, now: float | None = None) -> dict:
+    """
+    Per-minute rates of THROUGHPUT_KEYS over the run's `started_at`..`finished_at`
+    (or now) wall-clock window; empty before the run has started.
+    """
+    started = run.get("started_at")
+    if not started:
+        return {}
+    elapsed = (run.get("finished_at") or now or time.time()) - started
+    if elapsed <= 0:
+        return {}
+    rates = {f"{key}_per_min": round(run.get(key, 0) * 60 / elapsed, 2) for key in THROUGHPUT_KEYS}
+    return rates | {"elapsed_seconds": round(elapsed, 1)}
@@ -0,0 +1,56 @@
+# backend/rate_limit.py
+# Small token-bucket rate limiter shared by the worker threads that talk to
+# external services (ACRCloud, Spotify, Instagram CDN).
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` calls per second with bursts of up to `burst`.
+    A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a call is allowed."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    One RateLimiter per host, created on first use.
+    `rates` overrides the default rate for specific hosts.
+    """
+
+    def __init__(self, default_rate: float, rates: dict[str, float] | None = None, burst: int = 1):
+        self.default_rate = default_rate
+        self.rates = dict(rates or {})
+        self.burst = burst
+        self._limiters: dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> None:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.rates.get(host, self.default_rate), self.burst)
+                self._limiters[host] = limiter
+        limiter.acquire()
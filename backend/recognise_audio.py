@@ -2,20 +2,23 @@ import os
 import sys
 import datetime
 import subprocess
-import json
-import uuid
-from dotenv import load_dotenv
-from acrcloud.recognizer import ACRCloudRecognizer
-from spotify_integration.csv_reader import append_history, write_current, read_history
-from backend.progress import PROGRESS_DATA
+import threading
+from functools import cache
+from concurrent.futures import ThreadPoolExecutor
+from spotify_integration.csv_reader import append_history, write_current
+from backend.progress import increment, raise_if_cancelled, record_outcome
+from backend.recognisers import Recogniser, get_chain
+from backend import fmp4
+from backend.crawl_watermark import ingested
+from backend.processed_index import ProcessedIndex, content_fingerprint
+from backend.recognition_cache import RecognitionCache, acoustic_fingerprint, content_key
 
 # -----------------------------------------------------------------------------
 # Run ID & Current Records
 # -----------------------------------------------------------------------------
-# # Unique identifier for this batch run (folder or single file)
-RUN_ID = PROGRESS_DATA.get('runId')
-# Accumulator for this run's records
+# Accumulator for this run's records (appended to from recognition threads)
 current_records = []
+_records_lock = threading.Lock()
 
 # -----------------------------------------------------------------------------
 # Initialize current-run CSV (clears previous contents)
@@ -23,135 +26,258 @@ current_records = []
 # write_current([])
 
 # -----------------------------------------------------------------------------
-# Load ACRCloud credentials and instantiate the SDK
+# Recognition backends (ACRCloud by default; see backend.recognisers)
 # -----------------------------------------------------------------------------
-load_dotenv()  # loads ACR_HOST, ACR_ACCESS_KEY, ACR_ACCESS_SECRET from .env
-ACR_HOST      = os.getenv("ACR_HOST")
-ACCESS_KEY    = os.getenv("ACR_ACCESS_KEY")
-ACCESS_SECRET = os.getenv("ACR_ACCESS_SECRET")
-RECOG_CONFIG = {
-    "host":           ACR_HOST,
-    "access_key":     ACCESS_KEY,
-    "access_secret":  ACCESS_SECRET,
-    "timeout":        10,
-}
-_recognizer = ACRCloudRecognizer(RECOG_CONFIG)
+# Results for audio we've already sent (shared across threads and runs)
+_cache = RecognitionCache()
 
 # -----------------------------------------------------------------------------
-# Utility: Which files we've already logged (history)
+# Trim & Convert Audio to 20 Second Recognition Windows
 # -----------------------------------------------------------------------------
-def get_logged_files() -> set[str]:
+# Length of the recognition window and the format handed to the recogniser
+TRIM_SECONDS = 20
+TRIM_SAMPLE_RATE = 8000
+# Parallel ffmpeg processes when trimming a batch
+TRIM_WORKERS = int(os.getenv("TRIM_WORKERS", str(os.cpu_count() or 2)))
+# Cut fragmented MP4 windows in-process before falling back to ffmpeg
+NATIVE_TRIM = os.getenv("NATIVE_TRIM", "1") == "1"
+
+# Windows to try, best first. A reel's song usually plays over its ending, so only
+# the tail is tried by default (and only the tail is downloaded, see
+# TAIL_DOWNLOAD_SECONDS); e.g. RECOGNITION_WINDOWS=tail,middle,head also tries the
+# middle and the start, at up to one recogniser call per window and full downloads.
+WINDOW_NAMES = ("tail", "middle", "head")
+DEFAULT_WINDOWS = ["tail"]
+RECOGNITION_WINDOWS = [w.strip() for w in os.getenv("RECOGNITION_WINDOWS", "tail").split(",") if w.strip()]
+if not RECOGNITION_WINDOWS or set(RECOGNITION_WINDOWS) - set(WINDOW_NAMES):
+    print(f"⚠ RECOGNITION_WINDOWS must list some of {WINDOW_NAMES}, got {RECOGNITION_WINDOWS}; "
+          f"using {','.join(DEFAULT_WINDOWS)}")
+    RECOGNITION_WINDOWS = DEFAULT_WINDOWS
+# "sequential": try windows in order and stop at the first match (fewest API calls)
+# "concurrent": send every window at once, keep the best-ranked match (lowest latency)
+RECOGNITION_WINDOW_MODE = os.getenv("RECOGNITION_WINDOW_MODE", "sequential")
+# Matches scoring below this (ACRCloud score, 0-100) count as no match for that window
+MIN_MATCH_SCORE = int(os.getenv("RECOGNITION_MIN_SCORE", "0"))
+
+def window_starts(duration: float, windows=RECOGNITION_WINDOWS, seconds: int = TRIM_SECONDS) -> list[tuple[str, float]]:
     """
-    Return set of file names already present in recognition_history.csv.
+    (window, start second) for each requested window of a `duration`s clip.
+    Windows overlapping an earlier one by more than half are dropped, so a
+    short clip is only sent once.
     """
-    df = read_history()
-    return set(df['file_name'].fillna('').tolist())
+    span = max(0.0, duration - seconds)
+    offsets = {"tail": span, "middle": span / 2, "head": 0.0}
+    picked = []
+    for name in windows:
+        start = offsets[name]
+        if all(abs(start - other) >= seconds / 2 for _, other in picked):
+            picked.append((name, start))
+    return picked
 
-# -----------------------------------------------------------------------------
-# Trim & Convert Audio to Last 20 Seconds
-# -----------------------------------------------------------------------------
-def convert_and_trim(file_path: str) -> str | None:
+def native_windows(file_path: str, windows=RECOGNITION_WINDOWS,
+                   seconds: int = TRIM_SECONDS) -> list[tuple[str, bytes]] | None:
     """
-    - Uses ffprobe to get total duration.
-    - Calculates `start = max(0, duration - 20)` to capture final 20s.
-    - Runs ffmpeg to extract that segment to MP3.
-    - If original was .mp4, replaces it.
-    Returns the path to the MP3 or None on failure.
+    Cut recognition windows out of an audio-only fragmented MP4 (what the reel
+    downloader writes) by copying its init segment and the moof/mdat fragments
+    in each window, with no decode and no subprocess. Clips start on fragment
+    boundaries, so each runs up to one fragment longer than `seconds`.
+    Returns [(window, clip)], or None if the container needs ffmpeg.
     """
-    base, ext = os.path.splitext(file_path)
-    is_mp4 = ext.lower() == ".mp4"
-    trimmed = f"{base}_trimmed.mp3"
+    try:
+        with open(file_path, "rb") as f:
+            buf = f.read()
+        layout = fmp4.parse(buf)
+        clips = [(name, fmp4.window(buf, start, seconds, layout))
+                 for name, start in window_starts(layout.duration, windows, seconds)]
+    except (OSError, fmp4.FMP4Error) as e:
+        print(f"↪️ Native trim skipped for {os.path.basename(file_path)}: {e}")
+        return None
+
+    print(f"✂️ Native trim: {os.path.basename(file_path)} ({', '.join(n for n, _ in clips)})")
+    return clips
 
+def probe_duration(file_path: str) -> float | None:
+    """Clip length in seconds via ffprobe, or None if it can't be read."""
+    p = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", file_path
+    ], capture_output=True, text=True)
+    try:
+        return float(p.stdout.strip())
+    except ValueError:
+        return None
+
+def convert_and_trim(file_path: str, seconds: int = TRIM_SECONDS, start: float | None = None) -> bytes | None:
+    """
+    Single ffmpeg pass over `seconds` of the clip, from `start` or, by default,
+    the final `seconds`:
+    - `-sseof`/`-ss` seek *before* the input, so nothing before the window is
+      decoded (and the default tail window needs no separate ffprobe).
+    - Encodes straight to mono 8 kHz WAV on stdout (what the fingerprinter uses).
+    Returns the WAV bytes, or None on failure. The original file is left in place.
+    """
+    seek = ["-sseof", f"-{seconds}"] if start is None else ["-ss", f"{start:.2f}"]
     try:
-        # Probe for duration
-        p = subprocess.run([
-            "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            file_path
-        ], capture_output=True, text=True)
-        out = p.stdout.strip()
-        duration = float(out) if out else 0.0
-
-        start = max(0, duration - 20)
         ff = subprocess.run([
-            "ffmpeg", "-y", "-i", file_path,
-            "-ss", str(start), "-t", "20",
-            "-vn", "-acodec", "libmp3lame", trimmed
+            "ffmpeg", "-v", "error", *seek, "-i", file_path,
+            "-t", str(seconds), "-vn", "-ac", "1", "-ar", str(TRIM_SAMPLE_RATE),
+            "-f", "wav", "pipe:1"
         ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        if ff.returncode != 0 or not os.path.exists(trimmed) or os.path.getsize(trimmed) < 1000:
+        if ff.returncode != 0 or len(ff.stdout) < 1000:
             print(f"❌ ffmpeg failed ({ff.returncode}): {ff.stderr.decode()}")
             return None
 
-        if is_mp4:
-            os.remove(file_path)
-            final = base + ".mp3"
-            os.rename(trimmed, final)
-            print(f"🔁 Converted & trimmed: {final}")
-            PROGRESS_DATA[RUN_ID]['audio_converted'] += 1
-            return final
-        PROGRESS_DATA[RUN_ID]['audio_converted'] += 1
-        return trimmed
+        print(f"🔁 Trimmed: {os.path.basename(file_path)} ({len(ff.stdout)} bytes)")
+        return ff.stdout
 
     except Exception as e:
         print(f"❌ Conversion error: {e}")
         return None
 
+def ffmpeg_windows(file_path: str, windows=RECOGNITION_WINDOWS,
+                   seconds: int = TRIM_SECONDS) -> list[tuple[str, bytes]]:
+    """Recognition windows decoded with ffmpeg; only the tail if the length is unknown."""
+    duration = probe_duration(file_path) if list(windows) != ["tail"] else None
+    if duration is None:
+        starts = [("tail", None)]
+    else:
+        starts = window_starts(duration, windows, seconds)
+    clips = [(name, convert_and_trim(file_path, seconds, start)) for name, start in starts]
+    return [(name, clip) for name, clip in clips if clip]
+
 # -----------------------------------------------------------------------------
-# ACRCloud Recognition via SDK
+# Recognition via the backend chain
 # -----------------------------------------------------------------------------
-def recognise_audio(file_path: str) -> dict | None:
+def _recognise_with(backend: Recogniser, audio: str | bytes, key: str | None, runId: str | None,
+                    acoustic=lambda: None) -> dict | None:
     """
-    Uses ACRCloud SDK to identify a 20s snippet from `file_path`. Returns JSON dict or None.
+    One backend call, answered from the recognition cache when possible: by exact
+    key, else by a similar-sounding entry. `acoustic()` returns the clip's acoustic
+    fingerprint (or None); it is only computed on an exact-key miss.
     """
-    if not os.path.exists(file_path):
-        print(f"❌ File not found: {file_path}")
-        return None
+    if backend.cacheable and key:
+        if backend.name != 'acrcloud':
+            key = f"{backend.name}:{key}"  # ACRCloud keeps the unprefixed keys it always had
+        cached = _cache.get(key)
+        if cached is None and acoustic() is not None:
+            cached = _cache.get_similar(acoustic(), backend.name)
+        if cached is not None:
+            increment(runId, 'recognition_cache_hits')
+            print(f"💾 Cache hit ({backend.name})")
+            return cached
+        increment(runId, 'recognition_cache_misses')
 
-    raw = _recognizer.recognize_by_file(file_path, 0, 20)
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        print("❌ Failed to parse SDK JSON:", raw)
+        res = backend.recognise(audio)
+    except Exception as e:
+        print(f"❌ {backend.name} recognition error: {e}")
+        return None
+    if backend.cacheable and key:
+        _cache.put(key, res, backend.name, acoustic())
+    return res
+
+def recognise_audio(audio: str | bytes, runId: str | None = None,
+                    chain: list[Recogniser] | None = None) -> dict | None:
+    """
+    Identify a 20s snippet. `audio` is either a file path or an in-memory clip
+    from prepare_file. Backends in `chain` (default: RECOGNISERS) are tried in
+    order until one matches; a "no result" beats an error when none does.
+    Returns the result JSON dict, or None. Identical snippets (and, with fpcalc,
+    same-sounding ones) are answered from the local recognition cache.
+    """
+    in_memory = isinstance(audio, (bytes, bytearray))
+    if not in_memory and not os.path.exists(audio):
+        print(f"❌ File not found: {audio}")
         return None
 
+    chain = chain or get_chain()
+    key = content_key(audio) if any(backend.cacheable for backend in chain) else None
+    acoustic = cache(lambda: acoustic_fingerprint(audio, TRIM_SECONDS))
+
+    best = None
+    for i, backend in enumerate(chain):
+        if i:
+            print(f"↪️ Falling back to {backend.name}")
+        res = _recognise_with(backend, audio, key, runId, acoustic)
+        code = (res or {}).get('status', {}).get('code')
+        if code == 0:
+            return res
+        if res is not None and (best is None or code == 1001):
+            best = res
+    return best
+
 # -----------------------------------------------------------------------------
-# Process One File
+# Pipeline Steps (used by process_file and the streaming pipeline stages)
 # -----------------------------------------------------------------------------
-def process_file(original_file: str, runId: str) -> None:
-    name = os.path.basename(original_file)
-    if name in get_logged_files():
-        print(f"⏭️ Skipping already processed: {name}")
-        return
+def claim_file(original_file: str, index: ProcessedIndex) -> str | None:
+    """
+    Fingerprint the clip and claim it in `index`.
+    Returns the fingerprint, or None if this audio was already processed.
+    """
+    fingerprint = content_fingerprint(original_file)
+    if not index.claim(fingerprint, original_file):
+        print(f"⏭️ Skipping already processed: {os.path.basename(original_file)}")
+        ingested(original_file)  # its audio is in the history already
+        return None
+    return fingerprint
 
-    print(f"🎧 Processing: {name}")
-    # proc = convert_and_trim(original_file)
-    proc = original_file
+def prepare_file(original_file: str, runId: str) -> list[tuple[str, bytes]]:
+    """
+    Cut the recognition windows of a clip. Returns [(window, in-memory clip)]
+    in RECOGNITION_WINDOWS order; empty on failure.
+    """
+    clips = native_windows(original_file) if NATIVE_TRIM else None
+    if clips is None:
+        clips = ffmpeg_windows(original_file)
+    if clips:
+        increment(runId, 'audio_converted')
+    return clips
+
+def _parse_match(res: dict | None) -> tuple[str, str, str]:
+    code = (res or {}).get('status', {}).get('code')
+    if code == 1001:
+        return 'NO_MATCH', '', ''
+    if code != 0:
+        # Service errors (rate limits, auth, undecodable audio) are failures, not misses
+        return 'RECOGNITION_FAILED', '', ''
+    m = res['metadata']['music'][0]
+    if int(m.get('score', 100)) < MIN_MATCH_SCORE:
+        return 'NO_MATCH', '', ''
+    title  = m.get('title', '')
+    artist = m.get('artists', [{}])[0].get('name', '')
+    return 'SUCCESS', title, artist
+
+def recognise_file(proc: list[tuple[str, bytes]], original_file: str, runId: str,
+                   chain: list[Recogniser] | None = None) -> tuple[str, str, str, str]:
+    """
+    Recognise a prepared clip's windows under RECOGNITION_WINDOW_MODE with the
+    backends in `chain` (default: RECOGNISERS).
+    Returns (status, title, artist, matched window). The status is NO_MATCH if
+    any window got an answer, RECOGNITION_FAILED if none did.
+    """
     if not proc:
-        status = 'PREPROCESS_FAILED'
-        title = artist = ''
+        return 'PREPROCESS_FAILED', '', '', ''
+    raise_if_cancelled(runId)
+
+    if RECOGNITION_WINDOW_MODE == 'concurrent' and len(proc) > 1:
+        with ThreadPoolExecutor(max_workers=len(proc), thread_name_prefix="window") as pool:
+            results = list(pool.map(lambda w: recognise_audio(w[1], runId, chain), proc))
     else:
-        res = recognise_audio(proc)
-        # clean up trimmed temp
-        if proc != original_file and proc.endswith('_trimmed.mp3'):
-            os.remove(proc)
-
-        if not res:
-            status = 'RECOGNITION_FAILED'
-            title = artist = ''
-        else:
-            msg = res.get('status', {}).get('msg', '')
-            if msg == 'Success':
-                m = res['metadata']['music'][0]
-                title  = m.get('title', '')
-                artist = m.get('artists', [{}])[0].get('name', '')
-                status = 'SUCCESS'
-            else:
-                status = 'NO_MATCH'
-                title = artist = ''
-
-    # Build the uniform record for CSV
+        results = (recognise_audio(clip, runId, chain) for _, clip in proc)
+
+    status = 'RECOGNITION_FAILED'
+    for (window, _), res in zip(proc, results):
+        outcome = _parse_match(res)
+        if outcome[0] == 'SUCCESS':
+            return (*outcome, window)
+        if outcome[0] == 'NO_MATCH':
+            status = 'NO_MATCH'
+    return status, '', '', ''
+
+def record_result(name: str, status: str, title: str, artist: str, runId: str,
+                  fingerprint: str, account: str | None = None, window: str = '') -> dict:
+    """Append the uniform record to history and the current run; returns it with its history `id`."""
     record = {
         'timestamp':   datetime.datetime.now().isoformat(),
         'file_name':   name,
@@ -159,30 +285,60 @@ def process_file(original_file: str, runId: str) -> None:
         'artist':      artist,
         'source':      status,
         'spotify_uri': '',                    # for phase 2
-        'account':     os.getenv('TARGET_INSTAGRAM', ''),
-        'run_id':      runId
+        'account':     account if account is not None else os.getenv('TARGET_INSTAGRAM', ''),
+        'run_id':      runId,
+        'fingerprint': fingerprint,
+        'match_window': window,
     }
 
     # Append into history and accumulate for current
-    append_history([record])
-    current_records.append(record)
-
+    record['id'] = append_history([record])[0]
+    with _records_lock:
+        current_records.append(record)
+    record_outcome(runId, status)
 
     # Console feedback
     if status == 'SUCCESS':
-        print(f"✅ Recognised: {title} – {artist}")
+        print(f"✅ Recognised: {title} – {artist} ({window} window)")
     elif status == 'NO_MATCH':
         print(f"❌ No match: {name}")
     else:
         print(f"❌ {status}: {name}")
+    return record
+
+# -----------------------------------------------------------------------------
+# Process One File
+# -----------------------------------------------------------------------------
+def process_file(original_file: str, runId: str, index: ProcessedIndex | None = None,
+                 account: str | None = None, chain: list[Recogniser] | None = None) -> dict | None:
+    """
+    Recognise one clip and record it in history.
+    `index` should be shared across a batch; a fresh one is loaded when omitted.
+    Returns the history record, or None if the clip was skipped.
+    """
+    name = os.path.basename(original_file)
+    if index is None:
+        index = ProcessedIndex()
+    fingerprint = claim_file(original_file, index)
+    if fingerprint is None:
+        return None
+
+    print(f"🎧 Processing: {name}")
+    proc = prepare_file(original_file, runId)
+    status, title, artist, window = recognise_file(proc, original_file, runId, chain)
+    record = record_result(name, status, title, artist, runId, fingerprint, account, window)
+    ingested(original_file)
+    return record
+
 # -----------------------------------------------------------------------------
 # Process Directory
 # -----------------------------------------------------------------------------
-def process_directory(dir_path: str) -> None:
+def process_directory(dir_path: str, runId: str) -> None:
     print(f"📂 Scanning: {dir_path}")
+    index = ProcessedIndex()
     for f in sorted(os.listdir(dir_path)):
         if f.lower().endswith(('.mp3', '.mp4')):
-            process_file(os.path.join(dir_path, f))
+            process_file(os.path.join(dir_path, f), runId, index)
 
 # -----------------------------------------------------------------------------
 # Entry Point
@@ -195,10 +351,10 @@ if __name__ == "__main__":
     path = sys.argv[1]
     runId = sys.argv[2]
     if os.path.isdir(path):
-        process_directory(path)
+        process_directory(path, runId)
     else:
         process_file(path, runId)
 
     # Write out the current-run CSV once everything's done
     write_current(current_records)
-    print(f"✅ Done. History & current logs updated (run_id={RUN_ID})")
\ No newline at end of file
+    print(f"✅ Done. History & current logs updated (run_id={runId})")
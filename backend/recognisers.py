@@ -0,0 +1,194 @@
+# backend/recognisers.py
+# Recognition backends behind one interface, so a run can pick its service
+# (or chain several) and load tests can run offline against a local fake.
+#
+# Every backend answers in ACRCloud's JSON layout, which the recognition
+# cache and recognise_audio already understand:
+#   {"status": {"code": 0, "msg": "Success"},
+#    "metadata": {"music": [{"title": ..., "artists": [{"name": ...}], "score": ...}]}}
+# code 0 = match, 1001 = no result, anything else = error (retried, never cached).
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from backend.rate_limit import HostRateLimiter, RateLimiter
+
+load_dotenv()  # loads ACR_HOST, ACR_ACCESS_KEY, ACR_ACCESS_SECRET from .env
+
+# Default chain, tried in order until one backend matches (e.g. "acrcloud,shazam")
+RECOGNISERS = os.getenv("RECOGNISERS", "acrcloud")
+
+CLIP_SECONDS = 20
+
+
+def result(code: int, msg: str, title: str = "", artist: str = "", score: int = 100) -> dict:
+    """A recognition result in ACRCloud's layout."""
+    res = {"status": {"code": code, "msg": msg}}
+    if code == 0:
+        res["metadata"] = {"music": [{"title": title, "artists": [{"name": artist}], "score": score}]}
+    return res
+
+
+def _read(audio: str | bytes) -> bytes:
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    with open(audio, "rb") as f:
+        return f.read()
+
+
+class Recogniser(abc.ABC):
+    """
+    Base class: `recognise(audio)` takes a file path or in-memory clip and
+    returns a result dict. `cacheable` results may be kept in the recognition cache.
+    """
+    name = "base"
+    cacheable = True
+
+    @abc.abstractmethod
+    def recognise(self, audio: str | bytes) -> dict:
+        ...
+
+
+class ACRCloudRecogniser(Recogniser):
+    name = "acrcloud"
+
+    def __init__(self):
+        self.host = os.getenv("ACR_HOST")
+        self.config = {
+            "host":          self.host,
+            "access_key":    os.getenv("ACR_ACCESS_KEY"),
+            "access_secret": os.getenv("ACR_ACCESS_SECRET"),
+            "timeout":       10,
+        }
+        # Max ACRCloud requests per second per host across all threads (0 = unlimited)
+        self.limiter = HostRateLimiter(float(os.getenv("ACR_MAX_RPS", "0")))
+        self._sdk = None
+        self._lock = threading.Lock()
+
+    def sdk(self):
+        """The process-wide ACRCloud SDK client, created on first use."""
+        if self._sdk is None:
+            with self._lock:
+                if self._sdk is None:
+                    from acrcloud.recognizer import ACRCloudRecognizer
+                    self._sdk = ACRCloudRecognizer(self.config)
+        return self._sdk
+
+    def recognise(self, audio):
+        self.limiter.acquire(self.host)
+        if isinstance(audio, (bytes, bytearray)):
+            raw = self.sdk().recognize_by_filebuffer(bytes(audio), 0, CLIP_SECONDS)
+        else:
+            raw = self.sdk().recognize_by_file(audio, 0, CLIP_SECONDS)
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return result(3000, f"Unparseable SDK response: {raw!r}")
+
+
+class ShazamRecogniser(Recogniser):
+    name = "shazam"
+
+    def __init__(self):
+        self.limiter = RateLimiter(float(os.getenv("SHAZAM_MAX_RPS", "1")))
+        self._shazam = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        """
+        The process-wide Shazam client and the event loop it runs on, created on
+        first use. The loop lives on its own daemon thread for the life of the
+        process, so worker threads come and go without leaking loops or clients.
+        """
+        if self._shazam is None:
+            with self._lock:
+                if self._shazam is None:
+                    from shazamio import Shazam
+
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="shazam-loop", daemon=True).start()
+                    self._loop = loop
+                    self._shazam = Shazam()
+        return self._shazam, self._loop
+
+    def recognise(self, audio):
+        self.limiter.acquire()
+        shazam, loop = self.client()
+        # shazamio >= 0.5 renamed recognize_song to recognize
+        call = getattr(shazam, "recognize", None) or shazam.recognize_song
+        try:
+            out = asyncio.run_coroutine_threadsafe(call(_read(audio)), loop).result()
+        except Exception as e:
+            return result(3000, f"Shazam error: {e}")
+        track = out.get("track")
+        if not track:
+            return result(1001, "No result")
+        return result(0, "Success", track.get("title", ""), track.get("subtitle", ""))
+
+
+class FakeRecogniser(Recogniser):
+    """
+    Offline stand-in for benchmarks and load tests. Outcomes and latency are
+    derived from a hash of the clip, so the same clip always gets the same answer.
+    Results are never cached, so repeated runs keep paying the simulated latency.
+    """
+    name = "fake"
+    cacheable = False
+
+    def __init__(self, latency: float | None = None, error_rate: float | None = None,
+                 match_rate: float | None = None):
+        self.latency = float(os.getenv("FAKE_RECOGNISER_LATENCY", "1.0")) if latency is None else latency
+        self.error_rate = float(os.getenv("FAKE_RECOGNISER_ERROR_RATE", "0.02")) if error_rate is None else error_rate
+        self.match_rate = float(os.getenv("FAKE_RECOGNISER_MATCH_RATE", "0.7")) if match_rate is None else match_rate
+
+    def recognise(self, audio):
+        digest = hashlib.blake2b(_read(audio), digest_size=16).digest()
+        rng = random.Random(digest)
+        time.sleep(self.latency * (0.5 + rng.random()))  # uniform around `latency`
+        roll = rng.random()
+        if roll < self.error_rate:
+            return result(3003, "Fake limit exceeded")
+        if roll < self.error_rate + (1 - self.error_rate) * self.match_rate:
+            tag = digest.hex()
+            return result(0, "Success", f"Fake Track {tag[:6]}", f"Fake Artist {tag[6:10]}",
+                          score=70 + digest[0] % 31)
+        return result(1001, "No result")
+
+
+BACKENDS = {cls.name: cls for cls in (ACRCloudRecogniser, ShazamRecogniser, FakeRecogniser)}
+
+_instances: dict[str, Recogniser] = {}
+_instances_lock = threading.Lock()
+
+
+def get_recogniser(name: str) -> Recogniser:
+    """Process-wide instance of backend `name`."""
+    with _instances_lock:
+        if name not in _instances:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown recogniser {name!r}; choose from {sorted(BACKENDS)}")
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
+
+
+def get_chain(names: str | list[str] | None = None) -> list[Recogniser]:
+    """
+    Backends to try in order, from a list or comma-separated string
+    (default: RECOGNISERS). Raises ValueError for unknown names.
+    """
+    if names is None:
+        names = RECOGNISERS
+    if isinstance(names, str):
+        names = names.split(",")
+    chain = [get_recogniser(n.strip()) for n in names if n.strip()]
+    if not chain:
+        raise ValueError("No recognisers configured")
+    return chain
@@ -0,0 +1,173 @@
+# backend/recognition_cache.py
+# Local cache of recognition results, so reels reusing the same trending sound
+# cost one ACRCloud call, not one each. Entries are keyed by an exact hash of the
+# clip sent; when chromaprint's `fpcalc` is installed they also carry an acoustic
+# fingerprint, and a clip that misses the exact key can reuse the result of a
+# stored clip that sounds the same (bit error rate within RECOGNITION_CACHE_MATCH_BER).
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from backend.storage import ensure_schema
+
+CACHE_PATH        = os.getenv("RECOGNITION_CACHE_PATH", "backend/logs/recognition_cache.db")
+CACHE_TTL         = float(os.getenv("RECOGNITION_CACHE_TTL_DAYS", "30")) * 86400
+CACHE_MAX_ENTRIES = int(os.getenv("RECOGNITION_CACHE_MAX_ENTRIES", "5000"))
+
+# Chromaprint's fpcalc binary; empty disables acoustic matching (exact keys only)
+FPCALC = os.getenv("FPCALC", shutil.which("fpcalc") or "")
+if not FPCALC:
+    # Reels reusing a sound are encoded separately, so exact keys alone almost never hit
+    print("⚠ fpcalc (chromaprint) not found: the recognition cache will not match reused sounds. "
+          "Install chromaprint or set FPCALC.")
+# Largest fraction of differing fingerprint bits still treated as the same audio
+MATCH_BER = float(os.getenv("RECOGNITION_CACHE_MATCH_BER", "0.2"))
+# Offsets tried when aligning fingerprints (items of ~0.12 s), for trims that start a little apart
+_MAX_SHIFT = 8
+# Fingerprints too short or too repetitive (silence, a flat tone) match far too
+# easily, so they are never compared by similarity
+_MIN_ITEMS = 40
+_MIN_DISTINCT = 0.5
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# ACRCloud status codes worth remembering: 0 = Success, 1001 = No result.
+# Anything else (rate limits, auth, network) must be retried, not cached.
+CACHEABLE_CODES = {0, 1001}
+
+
+def content_key(audio: str | bytes) -> str | None:
+    """Exact key of a clip: hash of the in-memory clip, or of the file's contents."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(audio, (bytes, bytearray)):
+        h.update(audio)
+        return h.hexdigest()
+    try:
+        with open(audio, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def acoustic_fingerprint(audio: str | bytes, length: int = 20) -> np.ndarray | None:
+    """
+    Chromaprint raw fingerprint (uint32 per ~0.12 s) of the first `length`
+    seconds, or None without fpcalc, on failure, or for audio with too little
+    variation to compare safely.
+    """
+    if not FPCALC:
+        return None
+    in_memory = isinstance(audio, (bytes, bytearray))
+    try:
+        p = subprocess.run([FPCALC, "-raw", "-length", str(length), "-" if in_memory else audio],
+                           input=bytes(audio) if in_memory else None, capture_output=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    line = next((l for l in p.stdout.decode(errors="replace").splitlines() if l.startswith("FINGERPRINT=")), "")
+    try:
+        items = [int(v) & 0xFFFFFFFF for v in line[len("FINGERPRINT="):].split(",") if v]
+    except ValueError:
+        return None
+    fp = np.array(items, dtype=np.uint32)
+    if len(fp) < _MIN_ITEMS or len(np.unique(fp)) < _MIN_DISTINCT * len(fp):
+        return None
+    return fp
+
+
+def _bit_error_rates(query: np.ndarray, stored: list[np.ndarray]) -> np.ndarray:
+    """Lowest bit error rate of `query` against each stored fingerprint over +-_MAX_SHIFT alignments."""
+    n, s = len(query), _MAX_SHIFT
+    padded = np.zeros((len(stored), n + 2 * s), dtype=np.uint32)
+    valid = np.zeros(padded.shape, dtype=bool)
+    for i, fp in enumerate(stored):
+        fp = fp[: n + s]
+        padded[i, s: s + len(fp)] = fp
+        valid[i, s: s + len(fp)] = True
+    best = np.ones(len(stored))
+    for shift in range(-s, s + 1):
+        window = padded[:, s + shift: s + shift + n]
+        mask = valid[:, s + shift: s + shift + n]
+        diff = _POPCOUNT[(window ^ query).view(np.uint8)].reshape(len(stored), n, 4).sum(axis=2)
+        overlap = mask.sum(axis=1)
+        ber = np.where(overlap >= n // 2, (diff * mask).sum(axis=1) / np.maximum(overlap, 1) / 32, 1.0)
+        best = np.minimum(best, ber)
+    return best
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recognitions (
+            key        TEXT PRIMARY KEY,
+            result     TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used  REAL NOT NULL
+        )""")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recognitions_last_used ON recognitions (last_used)')
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(recognitions)')}
+    if 'backend' not in existing:
+        conn.execute("ALTER TABLE recognitions ADD COLUMN backend TEXT NOT NULL DEFAULT 'acrcloud'")
+    if 'acoustic' not in existing:
+        conn.execute('ALTER TABLE recognitions ADD COLUMN acoustic BLOB')
+
+
+class RecognitionCache:
+    """
+    SQLite-backed LRU of parsed recognition results with a TTL.
+    Entries older than `ttl` seconds are ignored; beyond `max_entries`
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _conn(self):
+        return ensure_schema(self.path, 'recognitions', _init_schema)
+
+    def get(self, key: str) -> dict | None:
+        conn = self._conn()
+        row = conn.execute('SELECT result, created_at FROM recognitions WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with conn:
+            if now - row['created_at'] > self.ttl:
+                conn.execute('DELETE FROM recognitions WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE recognitions SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row['result'])
+
+    def get_similar(self, fingerprint: np.ndarray, backend: str = 'acrcloud') -> dict | None:
+        """Result of the closest-sounding live entry from `backend` within MATCH_BER, if any."""
+        conn = self._conn()
+        rows = conn.execute('SELECT key, acoustic FROM recognitions WHERE backend = ? AND acoustic IS NOT NULL '
+                            'AND created_at >= ?', (backend, time.time() - self.ttl)).fetchall()
+        if not rows:
+            return None
+        rates = _bit_error_rates(fingerprint, [np.frombuffer(r['acoustic'], dtype=np.uint32) for r in rows])
+        best = int(np.argmin(rates))
+        if rates[best] > MATCH_BER:
+            return None
+        return self.get(rows[best]['key'])
+
+    def put(self, key: str, result: dict, backend: str = 'acrcloud', fingerprint: np.ndarray | None = None) -> None:
+        code = result.get('status', {}).get('code')
+        if code not in CACHEABLE_CODES:
+            return
+        now = time.time()
+        acoustic = fingerprint.astype(np.uint32).tobytes() if fingerprint is not None else None
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO recognitions (key, result, created_at, last_used, backend, acoustic) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (key, json.dumps(result), now, now, backend, acoustic))
+            conn.execute('DELETE FROM recognitions WHERE key IN '
+                         '(SELECT key FROM recognitions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                         (self.max_entries,))
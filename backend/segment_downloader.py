@@ -0,0 +1,201 @@
+# backend/segment_downloader.py
+# Concurrent ranged downloads of reel audio segments.
+# One pooled requests.Session is shared across reels; each (bytestart, byteend)
+# segment streams straight into its own offset of a preallocated file, so the
+# reel is never held in memory and only failed ranges are retried.
+# download_tail fetches only the init segment and the final seconds instead.
+import os
+import re
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend import fmp4
+
+DOWNLOAD_WORKERS = int(os.getenv("SEGMENT_DOWNLOAD_WORKERS", "4"))
+MAX_RETRIES = 3
+_CHUNK = 64 * 1024
+
+# First request of a tail-only download; enough for ftyp + moov + sidx of a reel
+HEAD_PROBE_BYTES = int(os.getenv("TAIL_HEAD_PROBE_BYTES", "4096"))
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide session with a connection pool sized for the download workers."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(DOWNLOAD_WORKERS * 2, 10))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def set_cookies(cookies: list[dict], session: requests.Session | None = None) -> None:
+    """Copy Selenium-style cookie dicts into the download session."""
+    session = session or get_session()
+    for c in cookies:
+        session.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+
+
+if hasattr(os, "pwrite"):
+    def _pwrite(fd, data, offset, _lock=None):
+        os.pwrite(fd, data, offset)
+else:  # Windows: no positional writes, serialise seek+write
+    def _pwrite(fd, data, offset, _lock=threading.Lock()):
+        with _lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+
+
+def _check_partial(resp, start, end) -> None:
+    """
+    Raise unless the response is the requested byte range: a 206, or a 200 whose
+    Content-Range names exactly that range. A plain 200 is the whole file.
+    """
+    resp.raise_for_status()
+    if resp.status_code == 206:
+        return
+    m = _CONTENT_RANGE.match(resp.headers.get("Content-Range", "") or "")
+    if not m or (int(m.group(1)), int(m.group(2))) != (start, end):
+        raise IOError(f"range {start}-{end} not honoured (HTTP {resp.status_code})")
+
+
+def _fetch_range(session, fd, start, end, url) -> int:
+    """Stream one segment into the file at `start`. Returns bytes written."""
+    written = 0
+    with session.get(url, stream=True, timeout=30) as resp:
+        _check_partial(resp, start, end)
+        for chunk in resp.iter_content(chunk_size=_CHUNK):
+            if chunk:
+                if start + written + len(chunk) > end + 1:
+                    raise IOError(f"range {start}-{end} returned more than {end - start + 1} bytes")
+                _pwrite(fd, chunk, start + written)
+                written += len(chunk)
+    if written != end - start + 1:
+        raise IOError(f"range {start}-{end} returned {written} bytes")
+    return written
+
+
+def _coverage(extents: dict[int, int]) -> tuple[int, list[tuple[int, int]]]:
+    """Contiguous length from byte 0 and any gaps in the written extents."""
+    covered, gaps = 0, []
+    for start, length in sorted(extents.items()):
+        if start > covered:
+            gaps.append((covered, start))
+        covered = max(covered, start + length)
+    return covered, gaps
+
+
+def download_segments(segments, dest_path, session=None, workers: int = DOWNLOAD_WORKERS) -> bool:
+    """
+    Download `(start, end, url)` segments concurrently into `dest_path` at their byte offsets.
+    Verifies every range arrived in full and the file has no holes; failed ranges
+    are retried up to MAX_RETRIES times. Returns True if the file is complete.
+    """
+    session = session or get_session()
+    if not segments:
+        return False
+    total_hint = max(end for _, end, _ in segments) + 1
+
+    extents: dict[int, int] = {}
+    pending = sorted(segments)
+    fd = os.open(dest_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.ftruncate(fd, total_hint)
+        for attempt in range(MAX_RETRIES + 1):
+            if not pending:
+                break
+            if attempt:
+                print(f"   ↻ Retrying {len(pending)} failed ranges (attempt {attempt + 1})")
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="segment") as pool:
+                futures = [(seg, pool.submit(_fetch_range, session, fd, *seg)) for seg in pending]
+            failed = []
+            for (start, end, url), future in futures:
+                try:
+                    extents[start] = future.result()
+                    print(f"   → Downloaded bytes {start}-{end}")
+                except Exception as e:
+                    print(f"   ✖ Failed to download segment {start}-{end}: {e}")
+                    failed.append((start, end, url))
+            pending = failed
+
+        covered, gaps = _coverage(extents)
+        os.ftruncate(fd, covered)
+    finally:
+        os.close(fd)
+
+    if pending:
+        print(f"   ✖ {len(pending)} ranges still missing for {dest_path}")
+        return False
+    if gaps:
+        print(f"   ⚠ Byte gaps in {dest_path}: {gaps}")
+        return False
+    print(f"   ✔ Audio saved to {dest_path} ({covered} bytes)")
+    return True
+
+
+def _ranged_url(url: str, start: int, end: int) -> str:
+    """`url` with its bytestart/byteend query parameters set to [start, end]."""
+    parsed = urllib.parse.urlparse(url)
+    qs = urllib.parse.parse_qs(parsed.query)
+    qs["bytestart"], qs["byteend"] = [str(start)], [str(end)]
+    return urllib.parse.urlunparse(parsed._replace(query=urllib.parse.urlencode(qs, doseq=True)))
+
+
+def _fetch_bytes(session, url, start, end) -> bytes:
+    with session.get(_ranged_url(url, start, end), timeout=30) as resp:
+        _check_partial(resp, start, end)
+        data = resp.content
+    if len(data) != end - start + 1:
+        raise IOError(f"range {start}-{end} returned {len(data)} bytes")
+    return data
+
+
+def download_tail(url, dest_path, seconds: float, session=None) -> bool:
+    """
+    Fetch only what recognition needs from a segmented stream: its init segment
+    (ftyp + moov) and the trailing fragments covering the last `seconds`, located
+    through the stream's sidx. `url` is any captured segment URL of the stream.
+    Writes a compact fragmented MP4 (no sidx) and returns True, or False when the
+    stream has no usable index, so the caller can fall back to download_segments.
+    """
+    session = session or get_session()
+    try:
+        head = _fetch_bytes(session, url, 0, HEAD_PROBE_BYTES - 1)
+        while True:
+            boxes, sidx, need = fmp4.scan_init(head)
+            if need is None or sidx is not None and any(b.type == "moov" for b in boxes):
+                break
+            head += _fetch_bytes(session, url, len(head), max(need, len(head) + HEAD_PROBE_BYTES) - 1)
+        init = [b for b in boxes if b.type in ("ftyp", "moov")]
+        if sidx is None or not any(b.type == "moov" for b in init):
+            print("   ↪ No segment index, downloading the full stream")
+            return False
+
+        start, end, covered = fmp4.tail_range(sidx, seconds)
+        view = memoryview(head)
+        if end < len(head):
+            body = view[start:end + 1]
+        else:
+            body = _fetch_bytes(session, url, start, end)
+    except (requests.RequestException, IOError, fmp4.FMP4Error) as e:
+        print(f"   ↪ Tail download failed ({e}), downloading the full stream")
+        return False
+
+    with open(dest_path, "wb") as f:
+        for box in init:
+            f.write(view[box.start:box.end])
+        f.write(body)
+    size = sum(b.end - b.start for b in init) + len(body)
+    print(f"   ✔ Tail saved to {dest_path} ({size} of {end + 1} bytes, last {covered:.1f}s)")
+    return True
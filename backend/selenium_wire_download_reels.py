@@ -1,65 +1,48 @@
 import os
 import time
-import requests
-import urllib.parse
-import base64
-import json
 from datetime import datetime
 from dotenv import load_dotenv
 
-from seleniumwire import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from backend.progress import PROGRESS_DATA
-
-# Load Instagram credentials from .env file
+from backend.progress import PROGRESS_DATA, increment, observe, raise_if_cancelled, update
+from backend.recognise_audio import RECOGNITION_WINDOWS
+from backend.crawl_watermark import STOP_AFTER_SEEN, CrawlWatermark, reel_shortcode
+from backend.driver_pool import get_pool
+from backend.ig_session import restore_session, remember_session
+from backend.segment_downloader import download_segments, download_tail, get_session, set_cookies
+from backend.stream_capture import AUDIO_SCOPES, StreamCapture
+
+# Load Instagram credentials from .env file (checked when a login is needed)
 load_dotenv()
 IG_USERNAME = os.getenv("IG_USERNAME")
 IG_PASSWORD = os.getenv("IG_PASSWORD")
-if not IG_USERNAME or not IG_PASSWORD:
-    raise EnvironmentError("Set IG_USERNAME and IG_PASSWORD in a .env file")
 
 # TARGET_PROFILE = "romanianbits"
 # MAX_REELS = 4  # Limit how many reels to process
 
-# Setup Chrome with visible window
-chrome_options = Options()
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--window-size=1200,900")
-
-# Launch browser with Selenium Wire to capture network traffic
-driver = webdriver.Chrome(options=chrome_options)
-wait = WebDriverWait(driver, 15)
-
-# Clean URL by removing byte range parameters for comparison
-def clean_mp4_url(url):
-    parsed = urllib.parse.urlparse(url)
-    qs = urllib.parse.parse_qs(parsed.query)
-    qs.pop("bytestart", None)
-    qs.pop("byteend", None)
-    new_query = urllib.parse.urlencode(qs, doseq=True)
-    return urllib.parse.urlunparse(parsed._replace(query=new_query))
-
-# Extract and decode 'efg' query parameter to access metadata
-def extract_efg(url):
-    parsed = urllib.parse.urlparse(url)
-    qs = urllib.parse.parse_qs(parsed.query)
-    efg_val = qs.get("efg", [None])[0]
-    if efg_val:
-        try:
-            decoded = base64.b64decode(efg_val + "==").decode("utf-8")
-            return json.loads(decoded)
-        except Exception:
-            return {}
-    return {}
+# Ceilings for the event-driven waits (seconds)
+REEL_CAPTURE_TIMEOUT = float(os.getenv("REEL_CAPTURE_TIMEOUT", "5"))
+REEL_NAV_TIMEOUT = float(os.getenv("REEL_NAV_TIMEOUT", "5"))
+
+# When only the last N seconds of each reel are recognised (RECOGNITION_WINDOWS=tail,
+# the default), only those are downloaded (plus the init segment). 0 downloads the
+# whole audio stream, which the middle/head recognition windows need.
+_TAIL_ONLY = RECOGNITION_WINDOWS == ["tail"]
+TAIL_DOWNLOAD_SECONDS = float(os.getenv("TAIL_DOWNLOAD_SECONDS", "20" if _TAIL_ONLY else "0"))
+
+# Stop at reels ingested by earlier runs of the same account (see backend.crawl_watermark)
+INCREMENTAL_CRAWL = os.getenv("INCREMENTAL_CRAWL", "1") == "1"
+
+# Browsers come from backend.driver_pool, launched on first use
 
 # Login to Instagram and give time to manually handle MFA popups
-def insta_login():
+def insta_login(driver, wait):
+    if not IG_USERNAME or not IG_PASSWORD:
+        raise EnvironmentError("Set IG_USERNAME and IG_PASSWORD in a .env file")
     driver.get("https://www.instagram.com/accounts/login/")
-    time.sleep(3)
     wait.until(EC.presence_of_element_located((By.NAME, "username")))
     driver.find_element(By.NAME, "username").send_keys(IG_USERNAME)
     driver.find_element(By.NAME, "password").send_keys(IG_PASSWORD + Keys.ENTER)
@@ -71,137 +54,136 @@ def insta_login():
     # time.sleep(2)  # Allow time for MFA or other popups
     print("✔ Logged in successfully.")
 
-# Parse requests to find audio segment packets based on vencode_tag
-def find_audio_stream_packets(all_requests):
-    audio_streams = {}
-    for req in all_requests:
-        if not req.response or not req.path.lower().endswith(".mp4"):
-            continue
-        efg = extract_efg(req.url)
-        tag = efg.get("vencode_tag", "")
-        if "heaac" in tag and "audio" in tag:
-            parsed = urllib.parse.urlparse(req.url)
-            base = parsed.scheme + "://" + parsed.netloc + parsed.path
-            qs = urllib.parse.parse_qs(parsed.query)
-            start = int(qs.get("bytestart", ["0"])[0])
-            end = int(qs.get("byteend", ["0"])[0])
-            audio_streams.setdefault(base, []).append((start, end, req.url))
-
-    # Print out all streams for debugging
-    for base, segments in audio_streams.items():
-        segments.sort()
-        print(f"\nAudio stream base: {base}")
-        for s in segments:
-            print(f"  bytestart={s[0]} → byteend={s[1]}")
-    return audio_streams
-
-# Download audio segments sequentially and write to file
-def download_audio_segments(stream_base, segments, dest_path):
-    session = requests.Session()
-    for c in driver.get_cookies():
-        session.cookies.set(c["name"], c["value"], domain=c["domain"])
-    with open(dest_path, "wb") as f:
-        for start, end, url in segments:
-            print(f"   → Downloading bytes {start}-{end}")
-            try:
-                resp = session.get(url, stream=True, timeout=30)
-                resp.raise_for_status()
-                for chunk in resp.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            except Exception as e:
-                print(f"   ✖ Failed to download segment {start}-{end}: {e}")
-    print(f"   ✔ Audio saved to {dest_path}")
+# Download the stream's tail (or all of its segments) over the shared pooled session
+def download_audio_segments(driver, stream_base, segments, dest_path, tail_seconds=TAIL_DOWNLOAD_SECONDS):
+    session = get_session()
+    set_cookies(driver.get_cookies(), session)
+    if tail_seconds and download_tail(segments[0][2], dest_path, tail_seconds, session):
+        return True
+    return download_segments(segments, dest_path, session)
 
 # Open the first reel on the target profile
-def open_first_reel(target_profile):
+def open_first_reel(driver, wait, target_profile):
     driver.get(f"https://www.instagram.com/{target_profile}/reels/")
-    time.sleep(3)
-    first_reel = wait.until(EC.presence_of_element_located((By.XPATH, f"//a[contains(@href, '/{target_profile}/reel/')]")))
+    first_reel = wait.until(EC.element_to_be_clickable((By.XPATH, f"//a[contains(@href, '/{target_profile}/reel/')]")))
     first_reel.click()
     print("✔ Opened first reel.")
 
-# Let network traffic collect after video starts playing
-def watch_and_capture_packets():
+# Wait for the reel's video element, then for its audio stream to be observed
+def watch_and_capture_packets(wait, capture, seen_audio_bases, timeout=REEL_CAPTURE_TIMEOUT):
+    """
+    Returns (stream_base, segments) as soon as a new audio stream's bytestart=0 and
+    final segments have been seen, False if no video appeared, None if no stream
+    arrived before `timeout`.
+    """
     print("⏳ Waiting for video element to appear...")
     try:
         wait.until(EC.presence_of_element_located((By.TAG_NAME, "video")))
-        print("▶️ Video found, sleeping to let network packets accumulate...")
+        print("▶️ Video found, waiting for its audio stream...")
     except:
         print("Failed to find next video")
         return False
-    time.sleep(5)
+    return capture.wait_for_stream(timeout, exclude=seen_audio_bases)
 
-# Simulate arrow key to move to next reel
-def go_to_next_reel():
+# Simulate arrow key to move to next reel, returning once the URL changes
+def go_to_next_reel(driver, timeout=REEL_NAV_TIMEOUT):
     try:
+        previous_url = driver.current_url
         body = driver.find_element(By.TAG_NAME, "body")
         body.send_keys(Keys.ARROW_RIGHT)
         print("→ Sent ARROW_RIGHT to move to next reel.")
-        time.sleep(2)
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.1).until(lambda d: d.current_url != previous_url)
+        except Exception:
+            print("⚠ URL did not change after ARROW_RIGHT, continuing anyway.")
         return True
     except Exception as e:
         print(f"✖ Failed to move to next reel: {e}")
         return False
 
-# Main automation loop
-def download_user_reels(target_profile, limit, runId):
-    insta_login()
-    open_first_reel(target_profile=target_profile)
+# Walk the profile's reels with an already logged-in driver; returns reels downloaded.
+# `on_reel(path)` is called as soon as each reel's audio file is complete.
+# With a `watermark`, reels ingested by earlier runs are skipped without capturing
+# their audio, and the crawl stops after STOP_AFTER_SEEN of them in a row.
+def crawl_reels(driver, wait, target_profile, limit, runId, on_reel=None, watermark=None):
+    open_first_reel(driver, wait, target_profile=target_profile)
     out_dir = os.path.join("downloaded_reels", target_profile)
     os.makedirs(out_dir, exist_ok=True)
     reel_counter = 0
     seen_audio_bases = set()
-    all_requests = []
     fail_count = 0
-    MAX_FAILS = 10  # Stop after 5 consecutive failed attempts
+    seen_streak = 0
+
+    MAX_FAILS = 10  # Stop after 10 consecutive failed attempts
+
+    # Record audio segment metadata as responses arrive; ignore everything else
+    capture = StreamCapture()
+    driver.scopes = AUDIO_SCOPES
+    driver.response_interceptor = capture.response_interceptor
 
     while True:
+        raise_if_cancelled(runId)
         if reel_counter >= limit:
             print(f"✅ Reached max of {limit} reels. Exiting.")
             break
 
-        driver.requests.clear()
-        if not watch_and_capture_packets():
-            print("⚠ Video not found, moving on...")
-            fail_count += 1
-        else:
-            fail_count = 0  # Reset if we found a video
-
-        all_requests.extend(driver.requests)
-        audio_packets = find_audio_stream_packets(all_requests)
-
-        valid_streams = [(base, segs) for base, segs in audio_packets.items() if any(s[0] == 0 for s in segs)]
+        del driver.requests  # drop stored traffic (and bodies) from the last reel
+        shortcode = reel_shortcode(driver.current_url)
+        already_ingested = watermark is not None and watermark.seen(shortcode)
         success = False
+        picked = None
 
-        if valid_streams:
-            best_stream_base, best_segments = valid_streams[-1]
-
-            if best_stream_base not in seen_audio_bases:
+        if already_ingested:
+            # Nothing is picked for this reel, so its (settled) stream would otherwise
+            # be taken for the next reel's, ahead of that one's still-arriving stream
+            capture.clear()
+        else:
+            reel_started = time.monotonic()
+            picked = watch_and_capture_packets(wait, capture, seen_audio_bases)
+            observe(runId, "reel_capture_seconds", time.monotonic() - reel_started)
+            if picked is False:
+                print("⚠ Video not found, moving on...")
+
+        if picked:
+            best_stream_base, best_segments = picked
+            seen_audio_bases.add(best_stream_base)
+            if watermark is not None and watermark.seen(audio_base=best_stream_base):
+                already_ingested = True
+            else:
                 print("✔ Selected new audio stream:")
                 for start, end, _ in best_segments:
                     print(f"     - {start} to {end}")
-                seen_audio_bases.add(best_stream_base)
-                best_segments.sort()
                 dest_file = os.path.join(out_dir, f"{target_profile}_reel_{reel_counter}_audio.mp4")
-                download_audio_segments(best_stream_base, best_segments, dest_file)
-                reel_counter += 1
-                success = True
-                all_requests = [r for r in all_requests if best_stream_base not in r.url]
-            else:
-                print("⚠ Skipping duplicate audio stream.")
+                if download_audio_segments(driver, best_stream_base, best_segments, dest_file):
+                    reel_counter += 1
+                    success = True
+                    if watermark is not None:
+                        watermark.downloaded(dest_file, shortcode, best_stream_base)
+                    if on_reel:
+                        on_reel(dest_file)
+                elif os.path.exists(dest_file):
+                    os.remove(dest_file)
+            capture.discard(best_stream_base)
+        elif picked is None and not already_ingested:
+            print("✖ No new audio stream with bytestart=0 found.")
+
+        if already_ingested:
+            seen_streak += 1
+            print(f"⏭️ Reel {shortcode or '?'} already ingested ({seen_streak} in a row)")
+            if seen_streak >= STOP_AFTER_SEEN:
+                print("✅ Reached previously ingested reels. Stopping incremental crawl.")
+                break
         else:
-            print("✖ No valid stream with bytestart=0 found.")
-
-        if success:
-            fail_count = 0  # Reset fail counter on success
-            if runId in PROGRESS_DATA:
-                PROGRESS_DATA[runId]["reels_downloaded"] += 1
-                print(PROGRESS_DATA[runId]["reels_downloaded"], "reels downloaded so far.")
+            seen_streak = 0
+            if success:
+                fail_count = 0  # Reset fail counter on success
+                if runId in PROGRESS_DATA:
+                    increment(runId, "reels_downloaded")
+                    print(PROGRESS_DATA[runId]["reels_downloaded"], "reels downloaded so far.")
+                else:
+                    print(f"⚠ WARNING: runId {runId} not found in PROGRESS_DATA")
             else:
-                print(f"⚠ WARNING: runId {runId} not found in PROGRESS_DATA")
-        else:
-            fail_count += 1
+                fail_count += 1
 
         # Safety check: Stop after too many consecutive fails
         if fail_count >= MAX_FAILS:
@@ -209,12 +191,31 @@ def download_user_reels(target_profile, limit, runId):
             break
 
         # Always try moving to next reel
-        if not go_to_next_reel():
+        nav_started = time.monotonic()
+        if not go_to_next_reel(driver):
             print("⚠ Failed to move to next reel. Stopping.")
             break
+        observe(runId, "reel_navigation_seconds", time.monotonic() - nav_started)
 
-    PROGRESS_DATA[runId]["limit"] = reel_counter  # Update actual number of reels downloaded
-    driver.quit()
+    driver.response_interceptor = None
+    return reel_counter
+
+# Main automation loop
+def download_user_reels(target_profile, limit, runId, on_reel=None, incremental=None):
+    if incremental is None:
+        incremental = INCREMENTAL_CRAWL
+    with get_pool().acquire() as browser:
+        driver, wait = browser.driver, browser.wait
+        if not browser.logged_in:
+            # Cached cookies first; full login only if they no longer work
+            if not restore_session(driver):
+                insta_login(driver, wait)
+                remember_session(driver)
+            browser.logged_in = True
+        watermark = CrawlWatermark(target_profile) if incremental else None
+        reel_counter = crawl_reels(driver, wait, target_profile, limit, runId, on_reel, watermark)
+
+    update(runId, limit=reel_counter)  # Update actual number of reels downloaded
 
 # if __name__ == "__main__":
 #     main()
@@ -0,0 +1,46 @@
+# backend/storage.py
+# Shared SQLite plumbing for the on-disk stores (history, caches, indexes).
+import os
+import sqlite3
+import threading
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialised: set[tuple[str, str]] = set()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Return this thread's connection to the SQLite database at `path`.
+    Connections are opened once per thread in WAL mode so readers never
+    block the writer and appends stay cheap.
+    """
+    key = os.path.abspath(path)
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(key)
+    if conn is None:
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        conn = sqlite3.connect(key, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conns[key] = conn
+    return conn
+
+
+def ensure_schema(path: str, name: str, init) -> sqlite3.Connection:
+    """
+    Run `init(conn)` once per process for the store `name` at `path`
+    (CREATE TABLE IF NOT EXISTS, migrations...) and return the connection.
+    """
+    conn = connect(path)
+    key = (os.path.abspath(path), name)
+    if key not in _initialised:
+        with _schema_lock:
+            if key not in _initialised:
+                with conn:
+                    init(conn)
+                _initialised.add(key)
+    return conn
@@ -0,0 +1,164 @@
+# backend/stream_capture.py
+# Streaming capture of Instagram audio segments from selenium-wire traffic.
+# A response interceptor records only (stream base, bytestart, byteend, url)
+# for HE-AAC audio .mp4 requests as they arrive; bodies are never kept here,
+# and only the most recent streams are retained, so per-reel work stays flat.
+import base64
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+# Only .mp4 traffic is captured by selenium-wire at all
+AUDIO_SCOPES = [r".*\.mp4(\?.*)?$"]
+
+# Bounded in-proxy storage for whatever selenium-wire still records
+SELENIUMWIRE_OPTIONS = {
+    "request_storage": "memory",
+    "request_storage_max_size": 50,
+}
+
+# Streams kept while waiting for one of them to be picked
+MAX_STREAMS = 8
+
+# A stream with no new segments for this long is treated as fully buffered...
+SETTLE_SECONDS = float(os.getenv("REEL_CAPTURE_SETTLE", "0.75"))
+# ...but only once it has been captured for this long, so a pause right after
+# the first segments doesn't end the capture with a fraction of the audio
+MIN_CAPTURE_SECONDS = float(os.getenv("REEL_CAPTURE_MIN_SECONDS", "2.5"))
+
+_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+
+# Extract and decode 'efg' query parameter to access metadata
+def extract_efg(url):
+    parsed = urllib.parse.urlparse(url)
+    qs = urllib.parse.parse_qs(parsed.query)
+    efg_val = qs.get("efg", [None])[0]
+    if efg_val:
+        try:
+            decoded = base64.b64decode(efg_val + "==").decode("utf-8")
+            return json.loads(decoded)
+        except Exception:
+            return {}
+    return {}
+
+
+def parse_audio_segment(url) -> tuple[str, int, int] | None:
+    """
+    (stream base, bytestart, byteend) for an audio-only segment URL, else None.
+    Audio streams are identified by their `heaac` + `audio` vencode_tag.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if not parsed.path.lower().endswith(".mp4"):
+        return None
+    tag = extract_efg(url).get("vencode_tag", "")
+    if "heaac" not in tag or "audio" not in tag:
+        return None
+    qs = urllib.parse.parse_qs(parsed.query)
+    base = parsed.scheme + "://" + parsed.netloc + parsed.path
+    start = int(qs.get("bytestart", ["0"])[0])
+    end = int(qs.get("byteend", ["0"])[0])
+    return base, start, end
+
+
+class _Stream:
+    __slots__ = ("segments", "total", "first_seen", "updated")
+
+    def __init__(self):
+        self.segments: dict[int, tuple[int, str]] = {}
+        self.total: int | None = None   # full stream size, when the CDN tells us
+        self.first_seen = self.updated = time.monotonic()
+
+    def sorted_segments(self) -> list[tuple[int, int, str]]:
+        return sorted((s, e, u) for s, (e, u) in self.segments.items())
+
+    def has_head(self) -> bool:
+        return 0 in self.segments
+
+    def has_tail(self) -> bool:
+        return self.total is not None and max(e for e, _ in self.segments.values()) + 1 >= self.total
+
+
+class StreamCapture:
+    """
+    Per-stream segment metadata, filled from selenium-wire's proxy threads.
+    Install with `driver.response_interceptor = capture.response_interceptor`;
+    `wait_for_stream` wakes as soon as a usable stream has been observed.
+    """
+
+    def __init__(self, max_streams: int = MAX_STREAMS, settle: float = SETTLE_SECONDS,
+                 min_capture: float = MIN_CAPTURE_SECONDS):
+        self.max_streams = max_streams
+        self.settle = settle
+        self.min_capture = min_capture
+        self._streams: OrderedDict[str, _Stream] = OrderedDict()
+        self._cond = threading.Condition()
+
+    def response_interceptor(self, request, response):
+        if response.status_code >= 400:
+            return
+        seg = parse_audio_segment(request.url)
+        if seg:
+            m = _CONTENT_RANGE.match(response.headers.get("Content-Range", "") or "")
+            self.add(*seg, request.url, total=int(m.group(1)) if m else None)
+
+    def add(self, base: str, start: int, end: int, url: str, total: int | None = None) -> None:
+        with self._cond:
+            stream = self._streams.get(base)
+            if stream is None:
+                stream = self._streams[base] = _Stream()
+                while len(self._streams) > self.max_streams:
+                    self._streams.popitem(last=False)
+            # The same start can be re-requested with a longer range; keep the widest
+            known = stream.segments.get(start)
+            if known is None or end > known[0]:
+                stream.segments[start] = (end, url)
+            stream.total = total or stream.total
+            stream.updated = time.monotonic()
+            self._cond.notify_all()
+
+    def streams(self) -> list[tuple[str, list[tuple[int, int, str]]]]:
+        """Snapshot of captured streams (oldest first) with sorted segments."""
+        with self._cond:
+            return [(base, stream.sorted_segments()) for base, stream in self._streams.items()]
+
+    def discard(self, base: str) -> None:
+        with self._cond:
+            self._streams.pop(base, None)
+
+    def clear(self) -> None:
+        """Forget every captured stream, e.g. those of a reel skipped without picking one."""
+        with self._cond:
+            self._streams.clear()
+
+    def _pick(self, exclude, require_complete: bool):
+        now = time.monotonic()
+        for base, stream in reversed(self._streams.items()):
+            if base in exclude or not stream.has_head():
+                continue
+            settled = now - stream.updated >= self.settle and now - stream.first_seen >= self.min_capture
+            if not require_complete or stream.has_tail() or settled:
+                return base, stream.sorted_segments()
+        return None
+
+    def wait_for_stream(self, timeout: float, exclude=()) -> tuple[str, list[tuple[int, int, str]]] | None:
+        """
+        Block until the newest stream not in `exclude` has its bytestart=0 segment and
+        its final segment (known from Content-Range, or no new segments for `settle`s
+        once it has been captured for at least `min_capture`s).
+        At the `timeout` ceiling, fall back to any stream with a bytestart=0 segment.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                picked = self._pick(exclude, require_complete=True)
+                if picked:
+                    return picked
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self._pick(exclude, require_complete=False)
+                self._cond.wait(min(remaining, self.settle))
@@ -0,0 +1,194 @@
+# backend/streaming_pipeline.py
+# Staged producer/consumer version of run_full_pipeline.
+#
+#   download -> trim -> recognise -> resolve -> playlist write
+#
+# Stages are connected by bounded queues, so each reel flows through as soon
+# as its audio lands and a slow stage applies backpressure upstream instead of
+# letting work pile up in memory. Each stage has its own worker count.
+import os
+import queue
+import threading
+import time
+
+from backend import recognise_audio
+from backend.batch_recognise import RECOGNITION_WORKERS
+from backend.crawl_watermark import ingested
+from backend.processed_index import ProcessedIndex
+from backend.progress import increment, update
+from backend.recognisers import get_chain
+from backend.selenium_wire_download_reels import download_user_reels
+from spotify_integration.auth import get_spotify_client
+from spotify_integration.csv_reader import update_history_uris, write_current
+from spotify_integration.playlist_manager import get_or_create_playlist, add_tracks_to_playlist
+from spotify_integration.resolver import SEARCH_CONCURRENCY, SharedBackoff, resolve_track
+from spotify_integration.uri_cache import UriCache
+
+# Workers per stage (download and playlist write are always single-threaded)
+STAGE_WORKERS = {
+    "trim":      recognise_audio.TRIM_WORKERS,
+    "recognise": RECOGNITION_WORKERS,
+    "resolve":   SEARCH_CONCURRENCY,
+}
+QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "16"))
+
+# Playlist writes are batched: flush at this many URIs or after this idle time
+WRITE_BATCH = int(os.getenv("PLAYLIST_WRITE_BATCH", "25"))
+WRITE_FLUSH_SECONDS = float(os.getenv("PLAYLIST_WRITE_FLUSH_SECONDS", "3"))
+
+_DONE = object()
+
+
+class Stage:
+    """
+    `workers` threads applying `fn(item)` to items from `inbox`.
+    Non-None results go to `outbox`; once the last worker sees the end marker,
+    it is forwarded downstream. Errors are logged and the item is dropped.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self._alive = max(1, workers)
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+                        for i in range(self._alive)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                self.inbox.put(_DONE)  # let sibling workers see it too
+                break
+            try:
+                out = self.fn(item)
+            except Exception as e:
+                print(f"❌ {self.name} stage failed on {item!r}: {e}")
+                continue
+            if out is not None and self.outbox is not None:
+                self.outbox.put(out)
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.outbox is not None:
+            self.outbox.put(_DONE)
+
+    def join(self):
+        for t in self.threads:
+            t.join()
+
+
+def run_streaming_pipeline(instagram_username: str, playlist_name: str, limit: int, runId: str,
+                           workers: dict | None = None, queue_size: int = QUEUE_SIZE, recognisers=None,
+                           incremental: bool | None = None):
+    """
+    Crawl, recognise, resolve and add tracks for one account with all stages overlapped.
+    `workers` overrides STAGE_WORKERS per stage name; `recognisers` overrides RECOGNISERS;
+    `incremental` overrides INCREMENTAL_CRAWL.
+    """
+    workers = {**STAGE_WORKERS, **(workers or {})}
+    print(f"🚀 Streaming pipeline for {instagram_username} (workers={workers}, queue={queue_size})")
+
+    sp = get_spotify_client()
+    search_sp = get_spotify_client(retry_rate_limits=False)  # 429s go to the shared backoff
+    chain = get_chain(recognisers)
+    index = ProcessedIndex()
+    uri_cache = UriCache()
+    backoff = SharedBackoff()
+    run_records = []
+    records_lock = threading.Lock()
+
+    downloaded = queue.Queue(queue_size)
+    trimmed = queue.Queue(queue_size)
+    recognised = queue.Queue(queue_size)
+    resolved = queue.Queue(queue_size)
+
+    # -- stage functions ------------------------------------------------------
+    def trim(path):
+        fingerprint = recognise_audio.claim_file(path, index)
+        if fingerprint is None:
+            return None
+        return path, fingerprint, recognise_audio.prepare_file(path, runId)
+
+    def recognise(item):
+        path, fingerprint, proc = item
+        status, title, artist, window = recognise_audio.recognise_file(proc, path, runId, chain)
+        record = recognise_audio.record_result(os.path.basename(path), status, title, artist,
+                                               runId, fingerprint, instagram_username, window)
+        ingested(path)
+        with records_lock:
+            run_records.append(record)
+        increment(runId, 'track_recognition_processed')
+        return record if status == 'SUCCESS' else None
+
+    def resolve(record):
+        uri = resolve_track(search_sp, record['title'], record['artist'], uri_cache, backoff)
+        if not uri:
+            return None
+        increment(runId, 'tracks_resolved')
+        return record['id'], uri
+
+    playlist = {}
+    pending: dict[int, str] = {}
+
+    def flush():
+        if not pending:
+            return
+        try:
+            if 'id' not in playlist:
+                playlist['id'] = get_or_create_playlist(sp, playlist_name, instagram_username, runId)
+            add_tracks_to_playlist(sp, playlist['id'], list(pending.values()), runId, final=False)
+            update_history_uris(dict(pending))
+        except Exception as e:
+            # Keep draining `resolved`: a dead writer would block every stage and the crawler.
+            # The rows keep an empty spotify_uri, so a later phased run picks them up again.
+            print(f"❌ Playlist write of {len(pending)} tracks failed: {e}")
+            increment(runId, 'playlist_write_failures')
+            update(runId, playlist_error=f"{type(e).__name__}: {e}")
+        pending.clear()
+
+    def write_playlist():
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = resolved.get(timeout=WRITE_FLUSH_SECONDS)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                break
+            if item is not None:
+                row_id, uri = item
+                pending[row_id] = uri
+            if len(pending) >= WRITE_BATCH or (pending and time.monotonic() - last_flush >= WRITE_FLUSH_SECONDS):
+                flush()
+                last_flush = time.monotonic()
+        flush()
+
+    # -- wire up and run ------------------------------------------------------
+    stages = [
+        Stage("trim", trim, workers["trim"], downloaded, trimmed).start(),
+        Stage("recognise", recognise, workers["recognise"], trimmed, recognised).start(),
+        Stage("resolve", resolve, workers["resolve"], recognised, resolved).start(),
+    ]
+    writer = threading.Thread(target=write_playlist, name="playlist-writer", daemon=True)
+    writer.start()
+
+    try:
+        # downloaded.put blocks when trimming falls behind: backpressure on the crawler
+        download_user_reels(instagram_username, limit, runId, on_reel=downloaded.put, incremental=incremental)
+    finally:
+        downloaded.put(_DONE)
+        for stage in stages:
+            stage.join()
+        writer.join()
+
+    write_current(run_records)
+    update(runId, playlist_done=True)
+    print("✅ Streaming pipeline completed successfully!")
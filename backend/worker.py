@@ -0,0 +1,134 @@
+# backend/worker.py
+# Worker processes that execute queued runs (see backend.jobs).
+#
+#   python -m backend.worker --processes 2
+#
+# Each process claims one run at a time and executes run_full_pipeline (or
+# run_batch_pipeline for multi-account jobs) in its own process, away from the
+# API's event loop. A background thread renews the job's lease and persists
+# the run's progress snapshot.
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+
+from backend import jobs
+from backend.progress import cancel, start_run, status, subscribe, update
+
+# Idle workers look for new jobs this often (seconds)
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# Progress is persisted at most this often; the lease is renewed at least this often
+FLUSH_SECONDS = float(os.getenv("JOB_PROGRESS_FLUSH_SECONDS", "1"))
+HEARTBEAT_SECONDS = min(jobs.LEASE_SECONDS / 3, 10)
+
+
+def _keep_alive(runId: str, worker: str, stop: threading.Event, lost: threading.Event) -> None:
+    """
+    Persist changed progress every FLUSH_SECONDS and renew the lease. If the
+    lease was lost (the job was requeued for another worker), or could not be
+    renewed before it would expire, cancel the run and set `lost`, so this
+    worker stops instead of running it alongside another.
+    """
+    dirty = threading.Event()
+    unsubscribe = subscribe(runId, lambda stages: dirty.set())
+    last_beat = 0.0
+    renewed = time.monotonic()  # the claim took the lease just now
+    try:
+        while not stop.wait(FLUSH_SECONDS):
+            now = time.monotonic()
+            if dirty.is_set() or now - last_beat >= HEARTBEAT_SECONDS:
+                dirty.clear()
+                try:
+                    held = jobs.heartbeat(runId, worker, status(runId))
+                except Exception as e:
+                    # e.g. "database is locked": try again next tick while the lease lasts
+                    print(f"⚠ Heartbeat for run {runId} failed: {e}")
+                    dirty.set()
+                    if time.monotonic() - renewed < jobs.LEASE_SECONDS - HEARTBEAT_SECONDS:
+                        continue
+                    held = False
+                if not held:
+                    print(f"⚠ Lost the lease on run {runId}, cancelling it")
+                    lost.set()
+                    cancel(runId)
+                    return
+                renewed = last_beat = now
+    finally:
+        unsubscribe()
+
+
+def run_job(job: dict, worker: str) -> None:
+    """Execute one claimed job and record its outcome."""
+    # Imported here so the pipeline (Selenium, Spotify, recognisers) loads in the worker only
+    from backend.batch_pipeline import run_batch_pipeline
+    from backend.full_pipeline import run_full_pipeline
+
+    runId = job['run_id']
+    # Every attempt starts from the initial counters, not a lost attempt's progress
+    start_run(runId, (job['initial_progress'] or job['progress']) | {"started_at": time.time()})
+    stop, lost = threading.Event(), threading.Event()
+    keeper = threading.Thread(target=_keep_alive, args=(runId, worker, stop, lost), name="job-keepalive",
+                              daemon=True)
+    keeper.start()
+    print(f"🛠️ {worker} running {runId} for {job['account']} (attempt {job['attempts']})")
+    try:
+        if 'accounts' in job['params']:
+            run_batch_pipeline(runId=runId, **job['params'])
+        else:
+            run_full_pipeline(runId=runId, **job['params'])
+    except Exception as e:
+        if not lost.is_set():
+            traceback.print_exc()
+        outcome, error = jobs.FAILED, f"{type(e).__name__}: {e}"
+    else:
+        outcome, error = jobs.DONE, None
+    finally:
+        stop.set()
+        keeper.join()
+    if lost.is_set():
+        # The job belongs to another worker now; its outcome is theirs to record
+        print(f"🛑 Run {runId} cancelled after losing its lease")
+        return
+    update(runId, finished_at=time.time())
+    jobs.finish(runId, worker, outcome, status(runId), error)
+    print(f"{'✅' if outcome == jobs.DONE else '❌'} Run {runId} {outcome}")
+
+
+def worker_loop(name: str | None = None, once: bool = False) -> None:
+    """Claim and run jobs until interrupted (or until the queue is empty, with `once`)."""
+    worker = name or f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {worker} waiting for jobs")
+    while True:
+        job = jobs.claim(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(POLL_SECONDS)
+            continue
+        run_job(job, worker)
+
+
+def start_workers(count: int) -> list[multiprocessing.Process]:
+    """Spawn `count` worker processes (daemonic: they stop with their parent)."""
+    ctx = multiprocessing.get_context("spawn")
+    procs = []
+    for _ in range(count):
+        proc = ctx.Process(target=worker_loop, name="ig2spotify-worker", daemon=True)
+        proc.start()
+        procs.append(proc)
+    return procs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued ig2spotify pipeline jobs")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to run")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        worker_loop()
+    else:
+        for proc in start_workers(args.processes):
+            proc.join()
@@ -28,23 +28,64 @@ export function startRun(instagramUsername, limit, playlistName) {
 }
 
 
+/**
+ * Kick off one run over several accounts
+ * @param {{ instagram_username: string, playlist_name: string, limit: number }[]} accounts
+ * @returns {Promise<{ message: string, batchId: string, runIds: Object<string, string> }>}
+ */
+
+export function startBatch(accounts) {
+    return axios
+    .post(`${API_BASE}/api/batch`, { accounts })
+    .then(res => res.data);
+}
+
 /**
  * Poll the backend for the status of a run
  * @param {string} runId - The ID of the run to check
  * @returns {Promise<{ runId: string, processed: number, total: number, records: object[]}>}
  */
 
+// If backend didnt send steps build a single step object
+function withSteps(d) {
+    const steps = d.steps ?? {
+        recognise: { done: d.processed, total: d.total ?? d.limit },
+    }
+    return {...d, steps };
+}
+
 export function getStatus(runId) {
     return axios
         .get(`${API_BASE}/api/runs/${runId}/status`)
-        .then(res => {
-            const d = res.data;
-            // If backend didnt send steps build a single step object
-            const steps = d.steps ?? {
-                recognise: { done: d.processed, total: d.total },
-            }
-            return {...d, steps };
-        });
+        .then(res => withSteps(res.data));
+}
+
+
+/**
+ * Subscribe to pushed progress for a run (server-sent events)
+ * @param {string} runId - The ID of the run to follow
+ * @param {(status: object, stages: object) => void} onStatus - Called with each new snapshot
+ *   and the stage events ({ reel_downloaded: 2, ... }) since the previous one
+ * @param {(err: Event) => void} onError - Called if the stream fails; it is closed first
+ * @returns {() => void} - Closes the stream
+ */
+
+export function subscribeStatus(runId, onStatus, onError) {
+    const source = new EventSource(`${API_BASE}/api/runs/${runId}/events`);
+    source.addEventListener('progress', e => {
+        const { stages, status } = JSON.parse(e.data);
+        onStatus(withSteps(status), stages);
+    });
+    source.addEventListener('done', e => {
+        onStatus(withSteps(JSON.parse(e.data)), {});
+        source.close();
+    });
+    source.onerror = err => {
+        // EventSource would reconnect forever; let the caller fall back to polling
+        source.close();
+        if (onError) onError(err);
+    };
+    return () => source.close();
 }
 
 
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getStatus } from '../api';
+import { getStatus, subscribeStatus } from '../api';
 
 export default function StatusDashboard({ runId }) {
   const [status, setStatus] = useState(null);
@@ -8,7 +8,9 @@ export default function StatusDashboard({ runId }) {
 
   useEffect(() => {
     let interval;
+    let unsubscribe;
 
+    // Fallback when the event stream isn't available: poll the snapshot
     const fetchStatus = async () => {
       try {
         const data = await getStatus(runId);
@@ -24,9 +26,23 @@ export default function StatusDashboard({ runId }) {
       }
     };
 
-    fetchStatus();
+    if (window.EventSource) {
+      unsubscribe = subscribeStatus(
+        runId,
+        data => {
+          setStatus(data);
+          setLoading(false);
+        },
+        () => fetchStatus(),
+      );
+    } else {
+      fetchStatus();
+    }
 
-    return () => clearTimeout(interval);
+    return () => {
+      clearTimeout(interval);
+      if (unsubscribe) unsubscribe();
+    };
   }, [runId]);
 
   if (loading) return <p>Loading status...</p>;
@@ -1,12 +1,26 @@
 import os
+import weakref
 from dotenv import load_dotenv
+import requests
 import spotipy
+from urllib3.util.retry import Retry
 from spotipy.oauth2 import SpotifyOAuth
 
 # Load environment variables from .env
 load_dotenv()
 
-def get_spotify_client():
+TOKEN_CACHE_PATH = ".cache-ig2spotify"
+
+# current_user() id per live client, so it's fetched once per Spotify object
+_user_ids = weakref.WeakKeyDictionary()
+
+def get_spotify_client(retry_rate_limits: bool = True):
+    """
+    Authenticated client. spotipy retries 429s itself by default, sleeping per
+    thread and finally raising without the Retry-After header; callers that
+    coordinate their own backoff (spotify_integration.resolver) pass
+    retry_rate_limits=False to see every 429 as it happens.
+    """
     scope = "playlist-modify-private playlist-read-private"
 
     sp_oauth = SpotifyOAuth(
@@ -14,10 +28,33 @@ def get_spotify_client():
         client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
         redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
         scope=scope,
-        cache_path=".cache-ig2spotify"
+        cache_path=TOKEN_CACHE_PATH
     )
 
-    return spotipy.Spotify(auth_manager=sp_oauth)
+    if retry_rate_limits:
+        return spotipy.Spotify(auth_manager=sp_oauth)
+    return spotipy.Spotify(auth_manager=sp_oauth, requests_session=_session_without_429_retries())
+
+def _session_without_429_retries() -> requests.Session:
+    # spotipy's own retry policy minus 429. urllib3 retries any 429 carrying
+    # Retry-After unless told not to respect the header, whatever the forcelist.
+    retry = Retry(total=3, connect=None, read=False, allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                  status=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                  respect_retry_after_header=False)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def current_user_id(sp) -> str:
+    """
+    The authenticated user's id, memoised for the lifetime of `sp`.
+    """
+    user_id = _user_ids.get(sp)
+    if user_id is None:
+        user_id = _user_ids[sp] = sp.current_user()['id']
+    return user_id
 
 # Optional test
 if __name__ == "__main__":
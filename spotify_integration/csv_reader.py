@@ -2,18 +2,11 @@ import os
 import pandas as pd
 from filelock import FileLock
 
-# Columns required in both history and current CSVs
-REQUIRED_COLS = [
-    'timestamp',     # ISO timestamp of processing
-    'file_name',     # Source file name or URL
-    'title',         # Matched track title (empty if none)
-    'artist',        # Matched artist name (empty if none)
-    'source',        # Status or source code from ACRCloud
-    'spotify_uri',   # URI from Spotify lookup (empty until phase 2)
-    'account',       # Instagram account or profile identifier
-    'run_id'         # Unique identifier for this pipeline run
-]
+from spotify_integration import history_store
+from spotify_integration.history_store import REQUIRED_COLS
 
+# History lives in a SQLite store next to the legacy CSV path
+# (recognition_history.csv -> recognition_history.db), imported on first use.
 DEFAULT_HISTORY_PATH = 'backend/logs/recognition_history.csv'
 DEFAULT_CURRENT_PATH = 'backend/logs/recognition_current.csv'
 
@@ -36,24 +29,23 @@ def _ensure_csv(path: str) -> None:
 
 
 def read_history(path: str = DEFAULT_HISTORY_PATH) -> pd.DataFrame:
-    """Return the full history of processed clips."""
-    _ensure_csv(path)
-    lock = FileLock(path + '.lock')
-    with lock:
-        return pd.read_csv(path, dtype=str)
+    """Return the full history of processed clips (indexed by history row id)."""
+    return history_store.read_all(path)
 
 
-def append_history(records: list[dict], path: str = DEFAULT_HISTORY_PATH) -> None:
-    """Append new records to the history CSV (ignores empty lists)."""
-    if not records:
-        return
-    _ensure_csv(path)
-    df_new = pd.DataFrame(records)
-    lock = FileLock(path + '.lock')
-    with lock:
-        df = pd.read_csv(path, dtype=str)
-        df = pd.concat([df, df_new], ignore_index=True)
-        df.to_csv(path, index=False)
+def find_history(path: str = DEFAULT_HISTORY_PATH, **filters) -> pd.DataFrame:
+    """Indexed history lookup by file_name, run_id and/or account."""
+    return history_store.find(path, **filters)
+
+
+def append_history(records: list[dict], path: str = DEFAULT_HISTORY_PATH) -> list[int]:
+    """Append new records to the history store (ignores empty lists). Returns their row ids."""
+    return history_store.append(records, path)
+
+
+def update_history_uris(uris: dict[int, str], path: str = DEFAULT_HISTORY_PATH) -> None:
+    """Bulk-write Spotify URIs keyed by history row id (the read_history index)."""
+    history_store.update_spotify_uris(uris, path)
 
 
 def write_current(records: list[dict], path: str = DEFAULT_CURRENT_PATH) -> None:
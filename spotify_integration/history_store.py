@@ -0,0 +1,174 @@
+# spotify_integration/history_store.py
+# SQLite (WAL) backend for the recognition history.
+# Appends are single INSERTs and lookups by file_name / run_id / account hit
+# an index, instead of re-reading and rewriting the whole CSV per record.
+import os
+import sys
+import pandas as pd
+
+from backend.storage import ensure_schema
+
+# Columns required in both history and current logs
+REQUIRED_COLS = [
+    'timestamp',     # ISO timestamp of processing
+    'file_name',     # Source file name or URL
+    'title',         # Matched track title (empty if none)
+    'artist',        # Matched artist name (empty if none)
+    'source',        # Status or source code from ACRCloud
+    'spotify_uri',   # URI from Spotify lookup (empty until phase 2)
+    'account',       # Instagram account or profile identifier
+    'run_id',        # Unique identifier for this pipeline run
+    'fingerprint',   # Content hash of the downloaded audio (see backend.processed_index)
+    'match_window',  # Recognition window that matched: tail / middle / head (empty if none)
+]
+
+# Columns with a lookup index
+INDEXED_COLS = ['file_name', 'run_id', 'account', 'fingerprint']
+
+
+def store_path(path: str) -> str:
+    """
+    Map a history location (legacy .csv path or .db path) to its SQLite file.
+    `backend/logs/recognition_history.csv` -> `backend/logs/recognition_history.db`
+    """
+    base, ext = os.path.splitext(path)
+    return path if ext == '.db' else base + '.db'
+
+
+def _init_schema(conn) -> None:
+    conn.execute('CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(history)')}
+    for col in REQUIRED_COLS:
+        if col not in existing:
+            conn.execute(f"ALTER TABLE history ADD COLUMN {col} TEXT DEFAULT ''")
+    for col in INDEXED_COLS:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_history_{col} ON history ({col})')
+
+
+def _open(path: str):
+    """Open the store for `path`, importing the legacy CSV into an empty store the first time."""
+    db = store_path(path)
+    if path == db or not os.path.exists(path):
+        return ensure_schema(db, 'history', _init_schema)
+
+    def init(conn):
+        _init_schema(conn)
+        if conn.execute('SELECT 1 FROM history LIMIT 1').fetchone() is None:
+            _import_csv(conn, path, db)
+
+    # Runs once per process under the schema lock, so concurrent callers wait
+    # for the import instead of racing it or reading a half-filled store
+    return ensure_schema(db, 'history:' + os.path.abspath(path), init)
+
+
+def _rows(records: list[dict]) -> list[tuple]:
+    return [tuple('' if r.get(c) is None else str(r.get(c)) for c in REQUIRED_COLS) for r in records]
+
+
+def _frame(cursor) -> pd.DataFrame:
+    rows = cursor.fetchall()
+    df = pd.DataFrame([dict(r) for r in rows], columns=['id'] + REQUIRED_COLS)
+    return df.set_index('id')
+
+
+def append(records: list[dict], path: str) -> list[int]:
+    """Insert records; O(1) per record regardless of history size. Returns their row ids."""
+    if not records:
+        return []
+    conn = _open(path)
+    cols = ', '.join(REQUIRED_COLS)
+    marks = ', '.join('?' for _ in REQUIRED_COLS)
+    sql = f'INSERT INTO history ({cols}) VALUES ({marks})'
+    with conn:
+        return [conn.execute(sql, row).lastrowid for row in _rows(records)]
+
+
+def read_all(path: str) -> pd.DataFrame:
+    """Full history as a DataFrame indexed by row id."""
+    conn = _open(path)
+    return _frame(conn.execute(f'SELECT id, {", ".join(REQUIRED_COLS)} FROM history ORDER BY id'))
+
+
+def find(path: str, **filters) -> pd.DataFrame:
+    """
+    Indexed lookup, e.g. find(path, run_id=runId) or find(path, file_name=name, account=acct).
+    """
+    unknown = [c for c in filters if c not in INDEXED_COLS]
+    if unknown:
+        raise ValueError(f"Not an indexed history column: {unknown}")
+    conn = _open(path)
+    where = ' AND '.join(f'{c} = ?' for c in filters) or '1'
+    sql = f'SELECT id, {", ".join(REQUIRED_COLS)} FROM history WHERE {where} ORDER BY id'
+    return _frame(conn.execute(sql, tuple(filters.values())))
+
+
+def fingerprints(path: str) -> set[str]:
+    """All non-empty content fingerprints already recorded."""
+    conn = _open(path)
+    rows = conn.execute("SELECT DISTINCT fingerprint FROM history WHERE fingerprint != ''")
+    return {row['fingerprint'] for row in rows}
+
+
+def legacy_file_names(path: str) -> dict[str, str]:
+    """file_name -> latest timestamp of rows recorded before fingerprints existed."""
+    conn = _open(path)
+    rows = conn.execute("SELECT file_name, MAX(timestamp) AS ts FROM history "
+                        "WHERE fingerprint = '' AND file_name != '' GROUP BY file_name")
+    return {row['file_name']: row['ts'] for row in rows}
+
+
+def backfill_fingerprint(path: str, file_name: str, fingerprint: str) -> None:
+    """Set the fingerprint of `file_name`'s legacy rows (those recorded without one)."""
+    conn = _open(path)
+    with conn:
+        conn.execute("UPDATE history SET fingerprint = ? WHERE file_name = ? AND fingerprint = ''",
+                     (fingerprint, file_name))
+
+
+def update_spotify_uris(uris: dict[int, str], path: str) -> None:
+    """Write back Spotify URIs for the given row ids in one transaction."""
+    if not uris:
+        return
+    conn = _open(path)
+    with conn:
+        conn.executemany('UPDATE history SET spotify_uri = ? WHERE id = ?',
+                         [(uri, int(row_id)) for row_id, uri in uris.items()])
+
+
+def migrate_csv(csv_path: str, db_path: str | None = None) -> int:
+    """
+    One-shot import of a legacy history CSV into the SQLite store.
+    Skipped if this CSV was already imported. Returns the number of rows copied.
+    """
+    db = db_path or store_path(csv_path)
+    conn = ensure_schema(db, 'history', _init_schema)
+    with conn:
+        return _import_csv(conn, csv_path, db)
+
+
+def _import_csv(conn, csv_path: str, db: str) -> int:
+    # Caller owns the transaction
+    marker = 'migrated:' + os.path.abspath(csv_path)
+    if conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+        print(f"⏭️ Already migrated: {csv_path}")
+        return 0
+
+    df = pd.read_csv(csv_path, dtype=str).fillna('')
+    for c in REQUIRED_COLS:
+        if c not in df.columns:
+            df[c] = ''
+    records = df[REQUIRED_COLS].to_dict('records')
+    cols = ', '.join(REQUIRED_COLS)
+    marks = ', '.join('?' for _ in REQUIRED_COLS)
+    conn.executemany(f'INSERT INTO history ({cols}) VALUES ({marks})', _rows(records))
+    conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (marker, str(len(records))))
+    print(f"📦 Migrated {len(records)} history rows from {csv_path} to {db}")
+    return len(records)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m spotify_integration.history_store <history.csv> [history.db]")
+        sys.exit(1)
+    migrate_csv(*sys.argv[1:])
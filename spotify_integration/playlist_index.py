@@ -0,0 +1,85 @@
+# spotify_integration/playlist_index.py
+# Locally persisted track membership for our playlists, tagged with the
+# Spotify snapshot_id it reflects. As long as the playlist's snapshot is the
+# one we last saw (or produced ourselves), dedupe needs one cheap API call
+# instead of paging through every track.
+import os
+import time
+
+from backend.storage import ensure_schema
+
+INDEX_PATH = os.getenv("PLAYLIST_INDEX_PATH", "backend/logs/playlist_index.db")
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS playlists (
+            playlist_id  TEXT PRIMARY KEY,
+            snapshot_id  TEXT NOT NULL,
+            refreshed_at REAL NOT NULL
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS members (
+            playlist_id TEXT NOT NULL,
+            uri         TEXT NOT NULL,
+            PRIMARY KEY (playlist_id, uri)
+        )""")
+
+
+class PlaylistIndex:
+    """Membership index keyed by playlist id."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+
+    def _conn(self):
+        return ensure_schema(self.path, 'playlist_index', _init_schema)
+
+    def members(self, sp, playlist_id: str) -> set[str]:
+        """
+        Current track URIs of the playlist. Served locally when Spotify's
+        snapshot_id matches ours; refreshed in full when it changed elsewhere.
+        """
+        snapshot_id = sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+        conn = self._conn()
+        row = conn.execute('SELECT snapshot_id FROM playlists WHERE playlist_id = ?', (playlist_id,)).fetchone()
+        if row and row['snapshot_id'] == snapshot_id:
+            rows = conn.execute('SELECT uri FROM members WHERE playlist_id = ?', (playlist_id,))
+            return {r['uri'] for r in rows}
+
+        if row:
+            print(f"🔄 Playlist {playlist_id} changed outside ig2spotify, refreshing membership index...")
+        else:
+            print(f"🔄 Building membership index for playlist {playlist_id}...")
+        return self.refresh(sp, playlist_id, snapshot_id)
+
+    def refresh(self, sp, playlist_id: str, snapshot_id: str) -> set[str]:
+        """Page through the whole playlist and replace the stored membership."""
+        uris = set()
+        results = sp.playlist_items(playlist_id, fields='items(track(uri)),next', additional_types=('track',))
+        while results:
+            for item in results['items']:
+                if item.get('track') and item['track'].get('uri'):
+                    uris.add(item['track']['uri'])
+            results = sp.next(results) if results.get('next') else None
+
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM members WHERE playlist_id = ?', (playlist_id,))
+            conn.executemany('INSERT OR IGNORE INTO members (playlist_id, uri) VALUES (?, ?)',
+                             [(playlist_id, uri) for uri in uris])
+            self._set_snapshot(conn, playlist_id, snapshot_id)
+        return uris
+
+    def record_added(self, playlist_id: str, uris: list[str], snapshot_id: str) -> None:
+        """Apply one of our own playlist_add_items calls and the snapshot it returned."""
+        conn = self._conn()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO members (playlist_id, uri) VALUES (?, ?)',
+                             [(playlist_id, uri) for uri in uris])
+            self._set_snapshot(conn, playlist_id, snapshot_id)
+
+    @staticmethod
+    def _set_snapshot(conn, playlist_id: str, snapshot_id: str) -> None:
+        conn.execute('INSERT OR REPLACE INTO playlists (playlist_id, snapshot_id, refreshed_at) VALUES (?, ?, ?)',
+                     (playlist_id, snapshot_id, time.time()))
@@ -1,60 +1,137 @@
 ## Here we will manage the creation and management of Spotify playlists
+import json
+import os
+from filelock import FileLock
 from spotipy import Spotify
-from backend.app.main import PROGRESS_DATA
+from spotipy.exceptions import SpotifyException
+from spotify_integration.auth import TOKEN_CACHE_PATH, current_user_id
+from backend.progress import raise_if_cancelled, update
+from spotify_integration.playlist_index import PlaylistIndex
+from spotify_integration.playlist_writer import PlaylistWriter
+
+# Persisted membership so dedupe doesn't page through the whole playlist
+_index = PlaylistIndex()
+_writer = PlaylistWriter(_index)
+
+# name -> playlist id per Spotify user, stored next to the OAuth token cache
+PLAYLIST_CACHE_PATH = TOKEN_CACHE_PATH + "-playlists.json"
+_playlist_cache_lock = FileLock(PLAYLIST_CACHE_PATH + ".lock")
+
+def _load_playlist_cache() -> dict:
+    if not os.path.exists(PLAYLIST_CACHE_PATH):
+        return {}
+    try:
+        with open(PLAYLIST_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def _save_playlist_cache(cache: dict) -> None:
+    tmp = PLAYLIST_CACHE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, PLAYLIST_CACHE_PATH)
+
+def _fetch_playlist_names(sp: Spotify) -> dict[str, str]:
+    """Page through all of the user's playlists once; first playlist wins on duplicate names."""
+    names = {}
+    results = sp.current_user_playlists(limit=50)
+    while results:
+        for playlist in results['items']:
+            names.setdefault(playlist['name'], playlist['id'])
+        results = sp.next(results) if results.get('next') else None
+    return names
+
+def playlist_name_index(sp: Spotify, refresh=False) -> dict[str, str]:
+    """
+    Cached name -> playlist id index for the current user.
+    Built by paginating every playlist the first time (or when `refresh`).
+    """
+    user_id = current_user_id(sp)
+    with _playlist_cache_lock:
+        cache = _load_playlist_cache()
+        if refresh or user_id not in cache:
+            cache[user_id] = _fetch_playlist_names(sp)
+            _save_playlist_cache(cache)
+    return cache[user_id]
+
+def _forget_playlist(user_id: str, playlist_name: str) -> None:
+    with _playlist_cache_lock:
+        cache = _load_playlist_cache()
+        cache.get(user_id, {}).pop(playlist_name, None)
+        _save_playlist_cache(cache)
+
+def _playlist_exists(sp: Spotify, playlist_id: str) -> bool:
+    try:
+        sp.playlist(playlist_id, fields='id')
+    except SpotifyException as e:
+        if e.http_status == 404:
+            return False
+        raise
+    return True
 
 def get_or_create_playlist(sp: Spotify, playlist_name, instagram_username, runId, description="", public=False):
     """ 
     Get an existing playlist or create a new one if it doesn't exist.
-    Returns the playlist object.
+    Names missing from the cached index are looked up again on Spotify before
+    creating (the playlist may have been made or renamed elsewhere), and a
+    cached id Spotify no longer knows is dropped.
+    Returns the playlist id.
     """
-    current_user_id = sp.current_user()['id']
-    
-    # Check for existing playlists
-    playlists = sp.current_user_playlists(limit=50)
-    for playlist in playlists['items']:
-        if playlist['name'] == playlist_name:
-            print(f"🎵 Found existing playlist: {playlist['name']}")
-            return playlist['id']
-    
+    user_id = current_user_id(sp)
+
+    # Check for existing playlists (all pages, cached on disk)
+    names = playlist_name_index(sp)
+    if playlist_name in names and not _playlist_exists(sp, names[playlist_name]):
+        print(f"🗑️ Cached playlist {playlist_name} no longer exists")
+        _forget_playlist(user_id, playlist_name)
+        names = {}
+    if playlist_name not in names:
+        names = playlist_name_index(sp, refresh=True)
+    if playlist_name in names:
+        print(f"🎵 Found existing playlist: {playlist_name}")
+        return names[playlist_name]
+
     # Create a new playlist
     print(f"🎵 No existing playlist found, creating new playlist: {playlist_name}")
-    new_playlist = sp.user_playlist_create(current_user_id, name=playlist_name, public=public, description=description)
+    new_playlist = sp.user_playlist_create(user_id, name=playlist_name, public=public, description=description)
     playlist_url = new_playlist['external_urls']['spotify']
 
-    PROGRESS_DATA[runId]['playlist_url'] = playlist_url
+    # Our cached listing is stale now; record the new playlist in it
+    with _playlist_cache_lock:
+        cache = _load_playlist_cache()
+        cache.setdefault(user_id, {})[playlist_name] = new_playlist['id']
+        _save_playlist_cache(cache)
+
+    update(runId, playlist_url=playlist_url)
 
     return new_playlist['id']
 
-def add_tracks_to_playlist(sp: Spotify, playlist_id, track_uris, runId) -> None:
+def add_tracks_to_playlist(sp: Spotify, playlist_id, track_uris, runId, final: bool = True) -> None:
     """
     Add tracks to a specified playlist.
+    `final=False` for intermediate batches, so the run isn't marked playlist_done yet.
     """
+    raise_if_cancelled(runId)
     # Remove duplicates
     track_urls = list(dict.fromkeys(track_uris))
 
-    # get current tracks in playlist
-    existing_uris = set()
-    results = sp.playlist_tracks(playlist_id)
-    while results:
-        for item in results['items']:
-            existing_uris.add(item['track']['uri'])
-        if results['next']:
-            results = sp.next(results)
-        else:
-            break
+    # get current tracks in playlist (local index unless the snapshot moved)
+    existing_uris = _index.members(sp, playlist_id)
 
     # Filter only new tracks
     new_tracks = [uri for uri in track_urls if uri not in existing_uris]
     if not new_tracks:
         print("🎵 No new tracks to add.")
-        PROGRESS_DATA[runId]["tracks_matched"] += len(new_tracks)
-        PROGRESS_DATA[runId]["playlist_done"] = True
+        _writer.resume(sp, playlist_id, runId)
+        if final:
+            update(runId, playlist_done=True)
         return
-    
+
+    # Chunked, retried and journaled; tracks_matched grows per committed chunk
     print(f"🎵 Adding {len(new_tracks)} new tracks to playlist: {playlist_id}")
-    sp.playlist_add_items(playlist_id, new_tracks)
-    PROGRESS_DATA[runId]["tracks_matched"] += len(new_tracks)
-    PROGRESS_DATA[runId]["playlist_done"] = True
-    print(f"✅ Tracks added successfully")
-    return # Unsure if this is needed
+    added = _writer.write(sp, playlist_id, new_tracks, runId)
+    if final:
+        update(runId, playlist_done=True)
+    print(f"✅ {added} tracks added successfully")
 
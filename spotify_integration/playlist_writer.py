@@ -0,0 +1,185 @@
+# spotify_integration/playlist_writer.py
+# Bulk playlist writes: additions are split into API-sized chunks, each chunk
+# is retried with backoff on its own, and a journal of committed chunks lets
+# an interrupted backfill resume where it stopped. Only transient failures
+# (429, 5xx, network) are retried or resumed; a write Spotify rejects outright
+# is marked failed. Journal rows are claimed atomically, so two runs writing
+# to the same playlist never resume the same job. Adds are not idempotent, so
+# a retry after a failure Spotify may have applied re-checks membership first.
+import json
+import time
+
+import requests
+from spotipy.exceptions import SpotifyException
+
+from backend.progress import increment
+from backend.storage import ensure_schema
+from spotify_integration.playlist_index import PlaylistIndex
+
+CHUNK_SIZE = 100          # Spotify's limit for playlist_add_items
+MAX_RETRIES = 4
+BASE_BACKOFF = 1.0
+# A claimed job untouched for this long belongs to a run that died; it can be resumed
+STALE_CLAIM_SECONDS = 600
+
+PENDING, RUNNING, FAILED = 'pending', 'running', 'failed'
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_writes (
+            job_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+            playlist_id TEXT NOT NULL,
+            run_id      TEXT,
+            uris        TEXT NOT NULL,
+            committed   INTEGER NOT NULL DEFAULT 0,
+            created_at  REAL NOT NULL
+        )""")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_writes_playlist ON pending_writes (playlist_id)')
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(pending_writes)')}
+    if 'status' not in existing:
+        conn.execute(f"ALTER TABLE pending_writes ADD COLUMN status TEXT NOT NULL DEFAULT '{PENDING}'")
+    if 'claimed_at' not in existing:
+        conn.execute('ALTER TABLE pending_writes ADD COLUMN claimed_at REAL')
+    if 'error' not in existing:
+        conn.execute('ALTER TABLE pending_writes ADD COLUMN error TEXT')
+
+
+def _chunks(uris: list[str]) -> list[list[str]]:
+    return [uris[i:i + CHUNK_SIZE] for i in range(0, len(uris), CHUNK_SIZE)]
+
+
+def _retryable(e: Exception) -> bool:
+    """Rate limits, server errors and network failures; not 400/401/403/404."""
+    if isinstance(e, SpotifyException):
+        return e.http_status == 429 or e.http_status >= 500
+    return isinstance(e, requests.exceptions.RequestException)
+
+
+def _maybe_applied(e: Exception) -> bool:
+    """A retryable failure after which Spotify may still have applied the request (all but 429)."""
+    return not (isinstance(e, SpotifyException) and e.http_status == 429)
+
+
+def _backoff(e: Exception, attempt: int) -> float:
+    if isinstance(e, SpotifyException) and e.http_status == 429:
+        try:
+            return float((getattr(e, 'headers', None) or {}).get('Retry-After', BASE_BACKOFF))
+        except (TypeError, ValueError):
+            pass
+    return BASE_BACKOFF * 2 ** attempt
+
+
+class PlaylistWriter:
+    """Chunked, retrying, resumable playlist_add_items on top of a PlaylistIndex."""
+
+    def __init__(self, index: PlaylistIndex | None = None):
+        self.index = index or PlaylistIndex()
+
+    def _conn(self):
+        return ensure_schema(self.index.path, 'playlist_writes', _init_schema)
+
+    def write(self, sp, playlist_id: str, uris: list[str], runId: str | None = None) -> int:
+        """
+        Add `uris` (already deduped against the playlist) in chunks.
+        Unfinished writes left by an earlier crash are completed first, and
+        anything they added is dropped from `uris`.
+        Returns the number of tracks committed by this call.
+        """
+        resumed = self._resume(sp, playlist_id, runId)
+        uris = [uri for uri in uris if uri not in resumed]
+        if not uris:
+            return len(resumed)
+        conn = self._conn()
+        with conn:
+            cur = conn.execute('INSERT INTO pending_writes (playlist_id, run_id, uris, created_at, status, claimed_at) '
+                               'VALUES (?, ?, ?, ?, ?, ?)',
+                               (playlist_id, runId, json.dumps(uris), time.time(), RUNNING, time.time()))
+        added = self._run_job(sp, cur.lastrowid, playlist_id, uris, 0, runId, resumed=False)
+        return len(resumed) + len(added)
+
+    def resume(self, sp, playlist_id: str, runId: str | None = None) -> int:
+        """Complete unfinished writes to the playlist; returns the number of tracks added."""
+        return len(self._resume(sp, playlist_id, runId))
+
+    def _resume(self, sp, playlist_id: str, runId) -> set[str]:
+        conn = self._conn()
+        rows = conn.execute(
+            'SELECT job_id, uris, committed FROM pending_writes WHERE playlist_id = ? '
+            'AND (status = ? OR (status = ? AND claimed_at < ?)) ORDER BY job_id',
+            (playlist_id, PENDING, RUNNING, time.time() - STALE_CLAIM_SECONDS)).fetchall()
+        added = set()
+        for row in rows:
+            if not self._claim(row['job_id']):
+                continue  # another run got there first
+            uris = json.loads(row['uris'])
+            print(f"♻️ Resuming playlist write {row['job_id']} at chunk {row['committed'] + 1}")
+            added.update(self._run_job(sp, row['job_id'], playlist_id, uris, row['committed'], runId, resumed=True))
+        return added
+
+    def _claim(self, job_id: int) -> bool:
+        """Take a resumable job for this run; False if another run holds it."""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute('UPDATE pending_writes SET status = ?, claimed_at = ? WHERE job_id = ? '
+                               'AND (status = ? OR (status = ? AND claimed_at < ?))',
+                               (RUNNING, now, job_id, PENDING, RUNNING, now - STALE_CLAIM_SECONDS))
+        return cur.rowcount == 1
+
+    def _run_job(self, sp, job_id: int, playlist_id: str, uris: list[str], committed: int, runId,
+                 resumed: bool) -> list[str]:
+        chunks = _chunks(uris)
+        added = []
+        for n in range(committed, len(chunks)):
+            chunk = chunks[n]
+            if resumed and n == committed:
+                # A crash may have landed this chunk without journaling it
+                existing = self.index.members(sp, playlist_id)
+                chunk = [uri for uri in chunk if uri not in existing]
+            error = self._add_chunk(sp, playlist_id, chunk, n, len(chunks)) if chunk else None
+            if error is not None:
+                with self._conn() as conn:
+                    if _retryable(error):
+                        print(f"✖ Playlist write {job_id} stopped at chunk {n + 1}/{len(chunks)}; will resume next run")
+                        conn.execute('UPDATE pending_writes SET status = ?, error = ? WHERE job_id = ?',
+                                     (PENDING, str(error), job_id))
+                    else:
+                        print(f"✖ Playlist write {job_id} rejected at chunk {n + 1}/{len(chunks)}; not retrying")
+                        conn.execute('UPDATE pending_writes SET status = ?, error = ? WHERE job_id = ?',
+                                     (FAILED, str(error), job_id))
+                return added
+            with self._conn() as conn:
+                conn.execute('UPDATE pending_writes SET committed = ?, claimed_at = ? WHERE job_id = ?',
+                             (n + 1, time.time(), job_id))
+            added.extend(chunk)
+            increment(runId, "tracks_matched", len(chunk))
+            print(f"   ✔ Chunk {n + 1}/{len(chunks)}: {len(chunk)} tracks")
+
+        with self._conn() as conn:
+            conn.execute('DELETE FROM pending_writes WHERE job_id = ?', (job_id,))
+        return added
+
+    def _add_chunk(self, sp, playlist_id: str, chunk: list[str], n: int, total: int) -> Exception | None:
+        """
+        Add one chunk, retrying transient failures. Returns the final error, or None on success.
+        A retry after a 5xx or network error first drops tracks the failed attempt already added.
+        """
+        recheck = False
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                if recheck:
+                    existing = self.index.members(sp, playlist_id)
+                    chunk = [uri for uri in chunk if uri not in existing]
+                    if not chunk:
+                        return None
+                result = sp.playlist_add_items(playlist_id, chunk)
+                self.index.record_added(playlist_id, chunk, result['snapshot_id'])
+                return None
+            except Exception as e:
+                if not _retryable(e) or attempt == MAX_RETRIES:
+                    print(f"❌ Chunk {n + 1}/{total} failed: {e}")
+                    return e
+                recheck = recheck or _maybe_applied(e)
+                delay = _backoff(e, attempt)
+                print(f"⏳ Chunk {n + 1}/{total} failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
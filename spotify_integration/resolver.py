@@ -0,0 +1,132 @@
+# spotify_integration/resolver.py
+# Concurrent (title, artist) -> Spotify URI resolution.
+# spotipy is blocking, so each search runs in a worker thread while an asyncio
+# semaphore bounds how many are in flight. A 429 pauses every worker until
+# the Retry-After deadline instead of each one hammering the API on its own.
+# Pass a client from get_spotify_client(retry_rate_limits=False), so 429s
+# reach SharedBackoff with their Retry-After header instead of being retried
+# (and stripped of it) inside spotipy.
+import asyncio
+import os
+import time
+
+from spotipy.exceptions import SpotifyException
+
+from spotify_integration.search_tracks import find_track_uri
+from spotify_integration.uri_cache import UriCache
+
+SEARCH_CONCURRENCY = int(os.getenv("SPOTIFY_SEARCH_CONCURRENCY", "8"))
+MAX_RETRIES = 3
+DEFAULT_RETRY_AFTER = 5.0
+
+
+class SharedBackoff:
+    """Deadline shared by all search workers; nobody calls Spotify before it."""
+
+    def __init__(self):
+        self._resume_at = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def wait(self) -> None:
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def wait_sync(self) -> None:
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            time.sleep(delay)
+
+
+def _retry_after(e: SpotifyException) -> float:
+    headers = getattr(e, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+async def _resolve_one(sp, title, artist, sem, backoff):
+    """Returns (uri, confirmed): confirmed is False when the search errored out."""
+    async with sem:
+        for attempt in range(MAX_RETRIES + 1):
+            await backoff.wait()
+            try:
+                return await asyncio.to_thread(find_track_uri, sp, title, artist), True
+            except SpotifyException as e:
+                if e.http_status == 429 and attempt < MAX_RETRIES:
+                    delay = _retry_after(e)
+                    print(f"⏳ Spotify rate limited, backing off {delay:.0f}s")
+                    backoff.pause(delay)
+                    continue
+                print(f"❌ Spotify search failed for {title} – {artist}: {e}")
+                return None, False
+            except Exception as e:
+                print(f"❌ Spotify search failed for {title} – {artist}: {e}")
+                return None, False
+
+
+async def resolve_tracks_async(sp, pairs, concurrency: int = SEARCH_CONCURRENCY,
+                               cache: UriCache | None = None) -> dict[tuple[str, str], str | None]:
+    """
+    Resolve unique (title, artist) pairs concurrently.
+    Pairs known to the URI cache (hits and confirmed misses) cost no API calls.
+    Returns {(title, artist): uri or None}.
+    """
+    cache = cache or UriCache()
+    resolved = {}
+    pending = []
+    for pair in dict.fromkeys(pairs):
+        known, uri = cache.get(*pair)
+        if known:
+            resolved[pair] = uri
+        else:
+            pending.append(pair)
+    print(f"💾 {len(resolved)} tracks resolved from cache, {len(pending)} to search")
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    backoff = SharedBackoff()
+    results = await asyncio.gather(*(_resolve_one(sp, t, a, sem, backoff) for t, a in pending))
+    for (title, artist), (uri, confirmed) in zip(pending, results):
+        resolved[(title, artist)] = uri
+        if confirmed:
+            cache.put(title, artist, uri)
+    return resolved
+
+
+def resolve_tracks(sp, pairs, concurrency: int = SEARCH_CONCURRENCY,
+                   cache: UriCache | None = None) -> dict[tuple[str, str], str | None]:
+    """Blocking wrapper around resolve_tracks_async for the sync pipeline code."""
+    return asyncio.run(resolve_tracks_async(sp, pairs, concurrency, cache))
+
+
+def resolve_track(sp, title, artist, cache: UriCache | None = None,
+                  backoff: SharedBackoff | None = None) -> str | None:
+    """
+    Resolve a single pair from a worker thread (streaming pipeline).
+    Uses the same cache and 429 handling as resolve_tracks; share `backoff`
+    between threads so one rate limit pauses them all.
+    """
+    cache = cache or UriCache()
+    known, uri = cache.get(title, artist)
+    if known:
+        return uri
+    backoff = backoff or SharedBackoff()
+    for attempt in range(MAX_RETRIES + 1):
+        backoff.wait_sync()
+        try:
+            uri = find_track_uri(sp, title, artist)
+        except SpotifyException as e:
+            if e.http_status == 429 and attempt < MAX_RETRIES:
+                delay = _retry_after(e)
+                print(f"⏳ Spotify rate limited, backing off {delay:.0f}s")
+                backoff.pause(delay)
+                continue
+            print(f"❌ Spotify search failed for {title} – {artist}: {e}")
+            return None
+        except Exception as e:
+            print(f"❌ Spotify search failed for {title} – {artist}: {e}")
+            return None
+        cache.put(title, artist, uri)
+        return uri
+    return None
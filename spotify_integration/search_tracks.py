@@ -1,33 +1,39 @@
 import spotipy
 import urllib.parse
 
-def search_spotify_track(sp, title, artist):
+def find_track_uri(sp, title, artist):
     """
-    Searches Spotify for a given title and artist.
-    Returns the track URI if found, else None.
+    Strict `track:/artist:` search with a relaxed fallback.
+    Returns the top track URI or None; Spotify errors propagate to the caller.
     """
-    try:
-        # First try strict search
-        query = f'track:{title} artist:{artist}'
+    # First try strict search
+    query = f'track:{title} artist:{artist}'
+    results = sp.search(q=query, type='track', limit=3)
+    tracks = results.get('tracks', {}).get('items', [])
+
+    if not tracks:
+        # Fallback to more relaxed search
+        print("🔁 No strict match, trying relaxed query...")
+        query = f"{title} {artist}"
         results = sp.search(q=query, type='track', limit=3)
         tracks = results.get('tracks', {}).get('items', [])
 
-        if not tracks:
-            # Fallback to more relaxed search
-            print("🔁 No strict match, trying relaxed query...")
-            query = f"{title} {artist}"
-            results = sp.search(q=query, type='track', limit=3)
-            tracks = results.get('tracks', {}).get('items', [])
+    if not tracks:
+        print("❌ Still no match.")
+        return None
 
-        if not tracks:
-            print("❌ Still no match.")
-            return None
+    top_track = tracks[0]
+    print(f"✅ Found: {top_track['name']} – {top_track['artists'][0]['name']}")
+    return top_track['uri']
 
-        top_track = tracks[0]
-        track_uri = top_track['uri']
-        print(f"✅ Found: {top_track['name']} – {top_track['artists'][0]['name']}")
-        return track_uri
 
+def search_spotify_track(sp, title, artist):
+    """
+    Searches Spotify for a given title and artist.
+    Returns the track URI if found, else None.
+    """
+    try:
+        return find_track_uri(sp, title, artist)
     except Exception as e:
         print(f"❌ Spotify search failed: {e}")
         return None
@@ -0,0 +1,76 @@
+# spotify_integration/uri_cache.py
+# On-disk (title, artist) -> Spotify URI cache shared by every pipeline entry point.
+# Misses are cached too (with a shorter TTL) so songs Spotify doesn't have
+# stop costing two searches on every run.
+import os
+import re
+import time
+import unicodedata
+
+from backend.storage import ensure_schema
+
+CACHE_PATH = os.getenv("SPOTIFY_URI_CACHE_PATH", "backend/logs/spotify_uri_cache.db")
+HIT_TTL    = float(os.getenv("SPOTIFY_URI_CACHE_HIT_TTL_DAYS", "90")) * 86400
+MISS_TTL   = float(os.getenv("SPOTIFY_URI_CACHE_MISS_TTL_DAYS", "7")) * 86400
+
+# Credit clauses: bracketed "(feat. X)" / "[ft. X]" anywhere, or a trailing
+# " featuring X" up to the end or a " - " suffix ("Song feat. X - Remix" keeps
+# "- Remix"). A title that merely starts with the word ("Feat of Clay") is kept.
+_FEAT = re.compile(r'[\(\[]\s*(?:feat|ft|featuring)\b\.?[^\)\]]*[\)\]]'
+                   r'|\s+[\(\[]?(?:feat|ft|featuring)(?:\.\s*|\s+)\S.*?(?=\s+-\s|$)')
+_PUNCT = re.compile(r'[^\w\s]')
+_SPACE = re.compile(r'\s+')
+
+
+def _normalise(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = _FEAT.sub(' ', text)
+    text = _PUNCT.sub(' ', text)
+    return _SPACE.sub(' ', text).strip()
+
+
+def normalise_key(title: str, artist: str) -> str:
+    """
+    Cache key that treats "Song (feat. B)" / "SONG" / "song!" by "A ft. B" / "a" as the same track.
+    """
+    return f"{_normalise(title)}|{_normalise(artist)}"
+
+
+def _init_schema(conn) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS uris (
+            key         TEXT PRIMARY KEY,
+            uri         TEXT,
+            resolved_at REAL NOT NULL
+        )""")
+
+
+class UriCache:
+    """
+    Persistent resolution cache. `get` returns (known, uri): known is False when
+    the pair must be searched; uri is None for a cached confirmed miss.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, hit_ttl: float = HIT_TTL, miss_ttl: float = MISS_TTL):
+        self.path = path
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+
+    def _conn(self):
+        return ensure_schema(self.path, 'uris', _init_schema)
+
+    def get(self, title: str, artist: str) -> tuple[bool, str | None]:
+        row = self._conn().execute('SELECT uri, resolved_at FROM uris WHERE key = ?',
+                                   (normalise_key(title, artist),)).fetchone()
+        if row is None:
+            return False, None
+        ttl = self.hit_ttl if row['uri'] else self.miss_ttl
+        if time.time() - row['resolved_at'] > ttl:
+            return False, None
+        return True, row['uri']
+
+    def put(self, title: str, artist: str, uri: str | None) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO uris (key, uri, resolved_at) VALUES (?, ?, ?)',
+                         (normalise_key(title, artist), uri, time.time()))